@@ -1,10 +1,135 @@
-from flask import Flask, request, send_file, jsonify
-from PIL import Image
+from flask import Flask, Request, request, send_file, jsonify
+from PIL import Image, UnidentifiedImageError
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from result_cache import ResultCache, content_key
+from rotate import filters, quarter_turns, rotate_image
+from workers import PoolFull, RotationPool
+import json
 import os
 import requests
+import shutil
+import tempfile
+import zipfile
+
+
+# uploads and results larger than this many bytes are kept in temporary files instead of memory
+spool_bytes = int(os.environ.get('SPOOL_BYTES', 1024 * 1024))
+
+# most pixels an image may have, checked from its header before it is decoded
+max_pixels = int(os.environ.get('MAX_PIXELS', 40 * 1000 * 1000))
+
+# largest result kept in the cache, bigger results are made again every time rather than held in memory
+max_cached_bytes = int(os.environ.get('CACHE_MAX_ITEM_BYTES', 4 * 1024 * 1024))
+
+
+class SpooledRequest(Request):
+    """
+    request that keeps uploaded files in memory only up to spool_bytes
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode='rb+')
+
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
+
+# requests larger than MAX_UPLOAD_BYTES are refused before they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 32 * 1024 * 1024))
+
+# rotated images already made, kept in memory up to CACHE_MEMORY_BYTES and in CACHE_DIR up to CACHE_DISK_BYTES
+cache = ResultCache(int(os.environ.get('CACHE_MEMORY_BYTES', 64 * 1024 * 1024)),
+                    os.environ.get('CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')),
+                    int(os.environ.get('CACHE_DISK_BYTES', 1024 * 1024 * 1024)))
+
+# threads rotating the images of batch requests, shared by every request so a burst of batches cannot start more
+batch_pool = ThreadPoolExecutor(int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1)))
+
+# most images in one batch request
+max_batch_items = int(os.environ.get('MAX_BATCH_ITEMS', 64))
+
+# processes rotating images when WORKER_PROCESSES is set, otherwise images are rotated on the request thread
+# when every process is busy and MAX_QUEUED images are waiting, more requests are turned away with a 503
+worker_processes = int(os.environ.get('WORKER_PROCESSES', 0))
+if worker_processes > 0:
+    pool = RotationPool(worker_processes, int(os.environ.get('MAX_QUEUED', 2 * worker_processes)), spool_bytes)
+else:
+    pool = None
+
+# seconds a client turned away is asked to wait before trying again
+retry_after = int(os.environ.get('RETRY_AFTER', 1))
+
+img_ext = ['png', 'jpg', 'jpeg', 'gif']
+
+
+class ImageTooLarge(Exception):
+    """
+    raised when an image has more pixels than max_pixels
+    """
+
+
+def is_image_name(file_name):
+    extension = file_name.split('.')[-1]
+    return extension.lower() in img_ext
+
+
+def rotated_png(stream, angle, resample, block=False):
+    """
+    rotates an uploaded image, or finds the result of rotating it before
+    :param stream: file object of the uploaded image
+    :param angle: int angle in degrees
+    :param resample: string naming one of rotate.filters, for angles that are not right angles
+    :param block: True to wait for a worker process when they are all busy, False to raise PoolFull
+    :return: file object of the rotated image as PNG, positioned at its start
+    """
+    if quarter_turns(angle) is not None:
+        resample = None
+    key = content_key(stream, angle, 'PNG', resample)
+    result = cache.get(key)
+    if result is not None:
+        return BytesIO(result)
+
+    # opening only reads the header, so the size is known before any pixels are decoded
+    img = Image.open(stream)
+    if img.width * img.height > max_pixels:
+        raise ImageTooLarge('Image has %d pixels, at most %d are allowed' % (img.width * img.height, max_pixels))
+
+    if pool is not None:
+        new_file = pool.rotate(stream, img, angle, resample, block)
+        new_file.seek(0, 2)
+    else:
+        img = rotate_image(img, angle, resample)
+        new_file = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        img.save(new_file, 'PNG')
+    if new_file.tell() <= max_cached_bytes:
+        new_file.seek(0)
+        cache.put(key, new_file.read())
+    new_file.seek(0)
+    return new_file
+
+
+def batch_item(index, file_name, stream, angle, resample):
+    """
+    rotates one image of a batch, run on batch_pool
+    :return: tuple containing the dictionary describing the result for the manifest, and the PNG file object or None
+    """
+    item = {'index': index, 'name': file_name, 'angle': angle}
+    if not is_image_name(file_name):
+        item['error'] = 'File is not a typical image'
+        return item, None
+    try:
+        # the batch was already accepted, so its images wait for a worker process rather than being turned away
+        result = rotated_png(stream, angle, resample, block=True)
+    except UnidentifiedImageError:
+        item['error'] = 'No image found'
+        return item, None
+    except (ImageTooLarge, Image.DecompressionBombError, OSError, ValueError) as e:
+        item['error'] = 'Unable to rotate image: %s' % e
+        return item, None
+    item['file'] = '%03d_%s.png' % (index, os.path.splitext(os.path.basename(file_name))[0])
+    return item, result
+
 
 @app.route("/")
 def hello_world():
@@ -16,28 +141,95 @@ def rotation():
     img_file = request.files.get('image')
 
 
-    img_ext = ['png', 'jpg', 'jpeg', 'gif']
-    file_name = img_file.filename
-    extension = file_name.split('.')[-1]
-    if extension.lower() not in img_ext:
+    if not is_image_name(img_file.filename):
         return jsonify({'error': 'File is not a typical image'}), 400
 
-    img = Image.open(img_file)
+    # the angle is the first field of the query string, e.g. ?90, or given as ?angle=90
+    fields = request.query_string.decode('utf-8', 'replace').split('&')
+    try:
+        angle = int(request.args.get('angle', fields[0]))
+    except:
+        return jsonify({'error': 'Unable to convert request to an angle'}), 400
 
-    if img is None:
+    resample = request.args.get('filter', 'nearest').lower()
+    if resample not in filters:
+        return jsonify({'error': 'Filter must be one of ' + ', '.join(filters)}), 400
+
+    try:
+        result = rotated_png(img_file.stream, angle, resample)
+    except UnidentifiedImageError:
         return jsonify({'error': 'No image found'}), 400
+    except (ImageTooLarge, Image.DecompressionBombError) as e:
+        return jsonify({'error': str(e)}), 413
+    except (OSError, ValueError) as e:
+        return jsonify({'error': 'Unable to rotate image: %s' % e}), 400
+    except PoolFull:
+        return jsonify({'error': 'Server is busy'}), 503, {'Retry-After': str(retry_after)}
+
+    # the result is sent in chunks straight from its file
+    return send_file(result, mimetype='image/png')
+
+
+@app.route("/rotation/batch", methods=['POST'])
+def rotation_batch():
+    """
+    rotates many images in one request, given as repeated 'image' files with either one 'angle' field for every
+    image or one 'angle' field for all of them, and optionally a 'filter' field
+    returns a zip archive of the rotated images and results.json, which lists the file made from each image or why
+    it could not be rotated
+    """
+    img_files = request.files.getlist('image')
+    if not img_files:
+        return jsonify({'error': 'No image found'}), 400
+    if len(img_files) > max_batch_items:
+        return jsonify({'error': 'At most %d images can be sent at once' % max_batch_items}), 400
+    if pool is not None and pool.is_full():
+        return jsonify({'error': 'Server is busy'}), 503, {'Retry-After': str(retry_after)}
 
     try:
-        angle = int(request.query_string)
-    except:
+        angles = [int(angle) for angle in request.form.getlist('angle')]
+    except ValueError:
         return jsonify({'error': 'Unable to convert request to an angle'}), 400
-    img = img.rotate(angle, expand=True)
+    if len(angles) == 1:
+        angles = angles * len(img_files)
+    if len(angles) != len(img_files):
+        return jsonify({'error': 'Send one angle, or one angle for every image'}), 400
+
+    resample = request.form.get('filter', 'nearest').lower()
+    if resample not in filters:
+        return jsonify({'error': 'Filter must be one of ' + ', '.join(filters)}), 400
+
+    futures = [batch_pool.submit(batch_item, index, img_file.filename or '', img_file.stream, angle, resample)
+               for index, (img_file, angle) in enumerate(zip(img_files, angles))]
+
+    archive = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    items = []
+    # the images are already compressed as PNG, so they are stored as they are
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zip_file:
+        for future in futures:
+            item, result = future.result()
+            items.append(item)
+            if result is not None:
+                with zip_file.open(item['file'], 'w') as entry:
+                    shutil.copyfileobj(result, entry)
+                result.close()
+        zip_file.writestr('results.json', json.dumps(items, indent=2))
+    archive.seek(0)
+
+    return send_file(archive, mimetype='application/zip', as_attachment=True, download_name='rotated.zip')
+
+
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({'error': 'Request is larger than %d bytes' % app.config['MAX_CONTENT_LENGTH']}), 413
 
-    new_file = BytesIO()
-    img.save(new_file, 'PNG')
-    new_file.seek(0)
 
-    return send_file(new_file, mimetype='image/png')
+@app.route("/stats")
+def stats():
+    counters = cache.stats()
+    if pool is not None:
+        counters['pool'] = pool.stats()
+    return jsonify(counters)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+
+
+def content_key(stream, angle, image_format, resample=None):
+    """
+    names a rotation result by what it was made from, so the same image sent again finds the same result
+    :param stream: file object of the uploaded image, read in chunks and left at its start
+    :param angle: int angle in degrees
+    :param image_format: string for the format of the result, e.g. 'PNG'
+    :param resample: string naming the resampling filter, or None if the angle needs no resampling
+    :return: string key
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(64 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    key = '%s_%d_%s' % (digest.hexdigest(), angle % 360, image_format.lower())
+    if resample is not None:
+        key += '_' + resample
+    return key
+
+
+class ResultCache:
+    """
+    two-tier cache of encoded rotation results, each tier keeping the most recently used results within a byte budget:
+    one in memory, and one in a directory on disk so results survive restarts
+    """
+
+    def __init__(self, memory_bytes=64 * 1024 * 1024, directory=None, disk_bytes=1024 * 1024 * 1024):
+
+        self._memory_bytes = memory_bytes
+        self._directory = directory
+        self._disk_bytes = disk_bytes
+
+        # key to encoded result, least recently used first
+        self._memory = OrderedDict()
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+
+        # key to size of every result on disk, least recently used first
+        self._disk = OrderedDict()
+        self._disk_used_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.index_disk()
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+
+    def get(self, key):
+        """
+        finds a result, checking memory first and then disk
+        :param key: string as given by content_key()
+        :return: bytes of the encoded result, or None if it has not been made before
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return data
+
+        data = self.read_disk(key)
+        with self._lock:
+            if data is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self.remember(key, data)
+        return data
+
+
+    def put(self, key, data):
+        """
+        stores a result in memory and on disk
+        :param key: string as given by content_key()
+        :param data: bytes of the encoded result
+        :return: None
+        """
+        with self._lock:
+            self.remember(key, data)
+        self.write_disk(key, data)
+
+
+    def remember(self, key, data):
+        """
+        keeps a result in memory, forgetting the least recently used results to stay within the byte budget,
+        the lock must be held
+        :param key: string as given by content_key()
+        :param data: bytes of the encoded result
+        :return: None
+        """
+        if len(data) > self._memory_bytes:
+            return
+        if key in self._memory:
+            self._used_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._used_bytes += len(data)
+        while self._used_bytes > self._memory_bytes:
+            old_key, old_data = self._memory.popitem(last=False)
+            self._used_bytes -= len(old_data)
+
+
+    def disk_path(self, key):
+        return os.path.join(self._directory, key[:2], key)
+
+
+    def index_disk(self):
+        """
+        finds the results already on disk, oldest first by the time they were last used, and forgets the oldest
+        if they are over the disk budget
+        :return: None
+        """
+        found = []
+        for entry in os.scandir(self._directory):
+            if not entry.is_dir():
+                continue
+            for result in os.scandir(entry.path):
+                # temporary files of writes that never finished are left out
+                if result.is_file() and result.name.startswith(entry.name) and '_' in result.name:
+                    stat = result.stat()
+                    found.append((stat.st_mtime, result.name, stat.st_size))
+        for mtime, key, size in sorted(found):
+            self._disk[key] = size
+            self._disk_used_bytes += size
+        with self._lock:
+            self.evict_disk()
+
+
+    def evict_disk(self):
+        """
+        removes the least recently used results from disk until they fit the disk budget, the lock must be held
+        :return: None
+        """
+        while self._disk_used_bytes > self._disk_bytes and self._disk:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._disk_used_bytes -= old_size
+            try:
+                os.remove(self.disk_path(old_key))
+            except OSError:
+                # another process sharing the directory may have removed it already
+                pass
+
+
+    def read_disk(self, key):
+        """
+        reads a result from disk
+        :param key: string as given by content_key()
+        :return: bytes of the encoded result, or None if it is not on disk
+        """
+        if self._directory is None:
+            return None
+        try:
+            with open(self.disk_path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        # the modification time records the last use, so the order survives restarts
+        try:
+            os.utime(self.disk_path(key))
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            else:
+                self._disk[key] = len(data)
+                self._disk_used_bytes += len(data)
+                self.evict_disk()
+        return data
+
+
+    def write_disk(self, key, data):
+        """
+        writes a result to disk, through a temporary file so other requests never read half a result
+        :param key: string as given by content_key()
+        :param data: bytes of the encoded result
+        :return: None
+        """
+        if self._directory is None or len(data) > self._disk_bytes:
+            return
+        path = self.disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self._lock:
+            if key in self._disk:
+                self._disk_used_bytes -= self._disk.pop(key)
+            self._disk[key] = len(data)
+            self._disk_used_bytes += len(data)
+            self.evict_disk()
+
+
+    def stats(self):
+        """
+        counts how requests were served
+        :return: dictionary of counters
+        """
+        with self._lock:
+            hits = self._memory_hits + self._disk_hits
+            requests = hits + self._misses
+            return {
+                'memory_hits': self._memory_hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'hit_rate': hits / requests if requests else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._used_bytes,
+                'memory_budget': self._memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_used_bytes,
+                'disk_budget': self._disk_bytes,
+            }
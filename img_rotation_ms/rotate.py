@@ -0,0 +1,44 @@
+from PIL import Image
+
+
+# resampling filters that can be asked for by name, used only for angles that are not right angles
+filters = {
+    'nearest': Image.Resampling.NEAREST,
+    'bilinear': Image.Resampling.BILINEAR,
+    'bicubic': Image.Resampling.BICUBIC,
+}
+
+# counter-clockwise quarter turns to the transpose that makes them, in the same direction as Image.rotate()
+_quarter_turns = {
+    1: Image.Transpose.ROTATE_90,
+    2: Image.Transpose.ROTATE_180,
+    3: Image.Transpose.ROTATE_270,
+}
+
+
+def quarter_turns(angle):
+    """
+    finds how many quarter turns an angle is, for any multiple of 90 including negative angles and angles past 360
+    :param angle: int angle in degrees, counter-clockwise
+    :return: int from 0 to 3, or None if the angle is not a multiple of 90
+    """
+    if angle % 90:
+        return None
+    return angle // 90 % 4
+
+
+def rotate_image(img, angle, resample='nearest'):
+    """
+    rotates an image counter-clockwise, growing it to fit the rotated image
+    right angles only move pixels, so they are lossless and never resample
+    :param img: PIL Image
+    :param angle: int angle in degrees
+    :param resample: string naming one of filters, for angles that are not right angles
+    :return: PIL Image, which is img itself when the angle is a whole number of turns
+    """
+    turns = quarter_turns(angle)
+    if turns == 0:
+        return img
+    if turns is not None:
+        return img.transpose(_quarter_turns[turns])
+    return img.rotate(angle, resample=filters[resample], expand=True)
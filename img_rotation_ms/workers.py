@@ -0,0 +1,191 @@
+from PIL import Image
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from rotate import quarter_turns, rotate_image
+import math
+import tempfile
+import threading
+
+
+class PoolFull(Exception):
+    """
+    raised when every worker is busy and the queue of waiting images is full
+    """
+
+
+class SharedWriter:
+    """
+    file-like object writing into a shared memory block, so an encoded image is never pickled
+    """
+
+    def __init__(self, buf):
+
+        self._buf = buf
+        self._pos = 0
+
+
+    def write(self, data):
+        end = self._pos + len(data)
+        if end > len(self._buf):
+            raise ValueError('Rotated image is larger than expected')
+        self._buf[self._pos:end] = data
+        self._pos = end
+        return len(data)
+
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+
+def rotate_shared(source_name, source_size, result_name, angle, resample):
+    """
+    decodes, rotates, and encodes an image in a worker process, reading the upload from one shared memory block and
+    writing the PNG into another
+    :param source_name: string name of the shared memory block holding the upload
+    :param source_size: int number of bytes of the upload
+    :param result_name: string name of the shared memory block to write the PNG into
+    :param angle: int angle in degrees
+    :param resample: string naming one of rotate.filters, or None for right angles
+    :return: int number of bytes written
+    """
+    source = shared_memory.SharedMemory(source_name)
+    result = shared_memory.SharedMemory(result_name)
+    try:
+        view = source.buf[:source_size]
+        img = Image.open(BytesIO(view))
+        view.release()
+        img = rotate_image(img, angle, resample)
+
+        writer = SharedWriter(result.buf)
+        img.save(writer, 'PNG')
+        return writer.tell()
+    finally:
+        source.close()
+        result.close()
+
+
+def result_bound(img, angle):
+    """
+    finds the most bytes the PNG of a rotated image can take, from the size and mode in its header
+    :param img: PIL Image, opened but not decoded
+    :param angle: int angle in degrees
+    :return: int number of bytes
+    """
+    width, height = img.size
+    turns = quarter_turns(angle)
+    if turns is not None:
+        if turns % 2:
+            width, height = height, width
+    else:
+        radians = math.radians(angle)
+        cos = abs(math.cos(radians))
+        sin = abs(math.sin(radians))
+        width, height = (math.ceil(img.width * cos + img.height * sin) + 2,
+                         math.ceil(img.width * sin + img.height * cos) + 2)
+
+    if img.mode in ('I', 'F'):
+        pixel_bytes = 4
+    else:
+        pixel_bytes = len(img.getbands()) * (2 if ';16' in img.mode else 1)
+
+    # a filter byte on every row, a little for stored zlib blocks, and the chunks around the pixels
+    raw = width * height * pixel_bytes + height
+    return raw + raw // 1000 + len(img.info.get('icc_profile') or b'') + 64 * 1024
+
+
+class RotationPool:
+    """
+    rotates images in worker processes so rotations are not limited to one core by the GIL
+    uploads and results pass through shared memory, and at most workers + max_queued images are taken at once
+    """
+
+    def __init__(self, workers, max_queued, spool_bytes):
+
+        self._workers = workers
+        self._max_queued = max_queued
+        self._spool_bytes = spool_bytes
+        self._executor = ProcessPoolExecutor(workers)
+
+        # one slot for every image being rotated or waiting for a worker
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+        self._lock = threading.Lock()
+        self._taken = 0
+        self._rejected = 0
+
+
+    def rotate(self, stream, img, angle, resample, block=False):
+        """
+        rotates an uploaded image in a worker process
+        :param stream: file object of the uploaded image
+        :param img: PIL Image opened from stream, used only for the size and mode in its header
+        :param angle: int angle in degrees
+        :param resample: string naming one of rotate.filters, or None for right angles
+        :param block: True to wait for a slot, False to raise PoolFull if there is none
+        :return: file object of the rotated image as PNG, positioned at its start
+        """
+        if not self._slots.acquire(blocking=block):
+            with self._lock:
+                self._rejected += 1
+            raise PoolFull()
+        with self._lock:
+            self._taken += 1
+
+        source = None
+        result = None
+        try:
+            stream.seek(0, 2)
+            source_size = stream.tell()
+            stream.seek(0)
+            source = shared_memory.SharedMemory(create=True, size=max(source_size, 1))
+            position = 0
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                source.buf[position:position + len(chunk)] = chunk
+                position += len(chunk)
+            stream.seek(0)
+
+            result = shared_memory.SharedMemory(create=True, size=result_bound(img, angle))
+            length = self._executor.submit(rotate_shared, source.name, source_size, result.name, angle,
+                                           resample).result()
+
+            new_file = tempfile.SpooledTemporaryFile(max_size=self._spool_bytes)
+            for start in range(0, length, 1024 * 1024):
+                chunk = result.buf[start:min(start + 1024 * 1024, length)]
+                new_file.write(chunk)
+                chunk.release()
+            new_file.seek(0)
+            return new_file
+        finally:
+            for block_memory in (source, result):
+                if block_memory is not None:
+                    block_memory.close()
+                    block_memory.unlink()
+            with self._lock:
+                self._taken -= 1
+            self._slots.release()
+
+
+    def is_full(self):
+        with self._lock:
+            return self._taken >= self._workers + self._max_queued
+
+
+    def stats(self):
+        """
+        counts the images in the pool
+        :return: dictionary of counters
+        """
+        with self._lock:
+            return {
+                'workers': self._workers,
+                'max_queued': self._max_queued,
+                'in_pool': self._taken,
+                'rejected': self._rejected,
+            }
+
+
+    def shutdown(self):
+        self._executor.shutdown()
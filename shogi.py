@@ -1,5 +1,18 @@
 from shogi_files.game import *
+from shogi_files.bitboard import BitboardGame
+from shogi_files.engine import Engine
 from shogi_files.tkinter_gui import *
+import sys
 
-game = Game()
-display_board(game)
+# 'python shogi.py --bitboard' plays on the bitboard backend, which generates moves faster
+if '--bitboard' in sys.argv:
+    game = BitboardGame()
+else:
+    game = Game()
+
+# 'python shogi.py --engine' plays against the computer as player 1
+engine = None
+if '--engine' in sys.argv:
+    engine = Engine(max_depth=3, time_limit=5.0)
+
+display_board(game, engine)
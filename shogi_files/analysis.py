@@ -0,0 +1,152 @@
+from shogi_files.game import *
+from shogi_files.bitboard import BitboardGame
+from shogi_files.engine import Engine, move_key, mate_score
+from shogi_files.perft import move_to_string
+from shogi_files.record import position_string
+from multiprocessing import Pool
+import argparse
+import os
+import sys
+import time
+
+
+# engine kept by each worker process, its transposition table is cleared for every root move
+_worker_engine = None
+
+
+def find_move(game, key):
+    """
+    finds the legal move in a game matching a move key
+    :param game: Game object
+    :param key: tuple as given by engine.move_key()
+    :return: tuple as given by Game.legal_moves(), or None if no legal move matches
+    """
+    for move in game.legal_moves(game.get_turn()):
+        if move_key(move) == key:
+            return move
+    return None
+
+
+def start_worker(table_size, quiescence=True):
+    """
+    sets up the engine of a worker process
+    :param table_size: int for the most positions kept in the transposition table
+    :param quiescence: True to extend the search through captures past the last ply
+    :return: None
+    """
+    global _worker_engine
+    _worker_engine = Engine(table_size=table_size, quiescence=quiescence)
+
+
+def analyse_move(task):
+    """
+    scores one root move with a fixed-depth search, run in a worker process
+    :param task: tuple containing the position string, the move key, and the depth to search including the move
+    :return: tuple containing the move key, the score for the player making the move, the nodes searched,
+             and the seconds taken
+    """
+    position, key, depth = task
+    if _worker_engine is None:
+        start_worker(65536)
+
+    start = time.perf_counter()
+    game = BitboardGame(cache_size=0)
+    game.set_up_board(position)
+    move = find_move(game, key)
+
+    game.make_move(*move)
+    game.switch_turn()
+    # a table left from other root moves would make the score depend on which moves this worker searched before
+    _worker_engine.clear_table()
+    score = -_worker_engine.fixed_depth(game, depth - 1)
+
+    return key, score, _worker_engine.get_nodes(), time.perf_counter() - start
+
+
+def analyse(game, depth=3, workers=None, table_size=65536, quiescence=True):
+    """
+    scores every root move of a position in parallel and picks the best one
+    each move gets its own full-window fixed-depth search with an empty transposition table, so no bounds or
+    positions are shared between root moves and the scores are the same for any number of workers
+    by default captures are followed past the last ply, so the scores are not plain minimax to the given depth
+    :param game: Game object, which is left as it was found
+    :param depth: int for the number of moves to look ahead, including the root move
+    :param workers: int for the number of worker processes, default is one per core, 1 searches in this process
+    :param table_size: int for the most positions kept in each worker's transposition table
+    :param quiescence: True to extend the search through captures past the last ply, False for plain fixed depth
+    :return: dictionary containing the best move, its score, the list of (move, score, nodes, seconds) for
+             every root move best first, the total nodes, the wall clock seconds, the seconds spent searching
+             summed over all workers, and the speed-up over one core
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    position = position_string(game)
+    moves = {move_key(move): move for move in game.legal_moves(game.get_turn())}
+    tasks = [(position, key, depth) for key in moves]
+
+    start = time.perf_counter()
+    if workers <= 1 or len(tasks) <= 1:
+        start_worker(table_size, quiescence)
+        results = [analyse_move(task) for task in tasks]
+    else:
+        with Pool(workers, start_worker, (table_size, quiescence)) as pool:
+            results = pool.map(analyse_move, tasks, chunksize=1)
+    elapsed = time.perf_counter() - start
+
+    results = sorted(((moves[key], score, nodes, seconds) for key, score, nodes, seconds in results),
+                     key=lambda result: result[1], reverse=True)
+
+    # time spent searching summed over every worker, which is roughly what one core would have needed
+    busy = sum(result[3] for result in results)
+
+    return {'best_move': results[0][0] if results else None,
+            'score': results[0][1] if results else -mate_score,
+            'moves': results,
+            'nodes': sum(result[2] for result in results),
+            'elapsed': elapsed,
+            'busy': busy,
+            'speed_up': busy / elapsed if elapsed else 1.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='score every move of a position using several processes')
+    parser.add_argument('-d', '--depth', type=int, default=3, help='number of moves to look ahead')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes, default is one per core')
+    parser.add_argument('-p', '--position', default=None, help='save file format string to analyse')
+    parser.add_argument('--no-quiescence', action='store_true',
+                        help='score the last ply as it stands instead of following captures past it')
+    parser.add_argument('--compare', action='store_true',
+                        help='also run on one core and report the measured speed-up')
+    args = parser.parse_args(argv)
+
+    game = BitboardGame()
+    if args.position is not None and not game.set_up_board(args.position):
+        print('Position could not be set up')
+        return 1
+
+    report = analyse(game, args.depth, args.workers, quiescence=not args.no_quiescence)
+    for move, score, nodes, seconds in report['moves']:
+        print('%-8s %7d  %8d nodes  %.2fs' % (move_to_string(move), score, nodes, seconds))
+
+    if report['best_move'] is None:
+        print('No legal moves')
+        return 0
+
+    print('Best move: %s' % move_to_string(report['best_move']))
+    print('Score: %d' % report['score'])
+    print('Nodes: %d' % report['nodes'])
+    print('Time: %.3fs' % report['elapsed'])
+    print('Estimated speed-up over one core: %.2fx' % report['speed_up'])
+
+    if args.compare:
+        single = analyse(game, args.depth, 1, quiescence=not args.no_quiescence)
+        print('Time on one core: %.3fs' % single['elapsed'])
+        if report['elapsed']:
+            print('Measured speed-up over one core: %.2fx' % (single['elapsed'] / report['elapsed']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
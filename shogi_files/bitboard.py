@@ -0,0 +1,593 @@
+from shogi_files.game import *
+
+
+_width = 9
+_height = 9
+_squares = _width * _height
+_full = (1 << _squares) - 1
+
+
+def index_of(col, row):
+    """
+    converts a board location to a bit index, matching Game.stoi()
+    :param col: column on the board
+    :param row: row on the board
+    :return: int for the bit representing the space
+    """
+    return _width - col + (row - 1) * _width
+
+
+def space_of(index):
+    """
+    converts a bit index to a board location, matching Game.itos()
+    :param index: int for the bit representing the space
+    :return: tuple containing board location in format: column, row
+    """
+    return _width - index % _width, index // _width + 1
+
+
+def bits_to_spaces(bits):
+    """
+    lists the spaces set in a bitboard
+    :param bits: int bitboard
+    :return: list of tuples representing spaces on the board
+    """
+    spaces = []
+    while bits:
+        low = bits & -bits
+        spaces.append(space_of(low.bit_length() - 1))
+        bits ^= low
+    return spaces
+
+
+def row_mask(rows):
+    """
+    creates a bitboard covering whole rows of the board
+    :param rows: iterable of row numbers
+    :return: int bitboard
+    """
+    mask = 0
+    for row in rows:
+        if row is not None:
+            mask |= ((1 << _width) - 1) << ((row - 1) * _width)
+    return mask
+
+
+def build_rays():
+    """
+    creates a bitboard for every square and direction covering all squares in that direction
+    :return: dictionary of direction tuple to list of bitboards indexed by square
+    """
+    rays = {}
+    for x, y in Game._rays:
+        rays[(x, y)] = []
+        for index in range(_squares):
+            col, row = space_of(index)
+            mask = 0
+            col += x
+            row += y
+            while 1 <= col <= _width and 1 <= row <= _height:
+                mask |= 1 << index_of(col, row)
+                col += x
+                row += y
+            rays[(x, y)].append(mask)
+    return rays
+
+
+_rays = build_rays()
+
+# directions whose bit index increases, so the nearest blocker is the lowest bit
+_ascending = {(x, y): -x + _width * y > 0 for x, y in Game._rays}
+
+
+def build_kind_tables(reverse=False):
+    """
+    creates the step-attack tables and slide directions of every kind of piece for both players
+    :param reverse: True to flip every direction, giving the spaces a piece could attack a square from
+    :return: dictionary of player to list indexed by kind, each entry a tuple containing the list of
+             step bitboards indexed by square and the list of directions the kind slides in
+    """
+    tables = {}
+    for player in (True, False):
+        tables[player] = []
+        for cls, promoted in piece_kinds:
+            piece = cls(player, (0, 0))
+            if promoted:
+                piece.promote_piece()
+
+            steps = []
+            slides = []
+            for dirs, limit in piece.get_dirs():
+                for x, y in dirs:
+                    if reverse:
+                        x, y = -x, -y
+                    if limit == -1:
+                        slides.append((x, y))
+                    else:
+                        steps.append((x, y))
+
+            step_table = []
+            for index in range(_squares):
+                col, row = space_of(index)
+                mask = 0
+                for x, y in steps:
+                    if 1 <= col + x <= _width and 1 <= row + y <= _height:
+                        mask |= 1 << index_of(col + x, row + y)
+                step_table.append(mask)
+
+            tables[player].append((step_table, slides))
+    return tables
+
+
+_attack_tables = build_kind_tables()
+_reverse_tables = build_kind_tables(reverse=True)
+
+# space of every bit index, so move generation never converts indexes one at a time
+_spaces = [space_of(index) for index in range(_squares)]
+
+# bitboard of every column, indexed by index % _width
+_columns = [sum(1 << (row * _width + column) for row in range(_height)) for column in range(_width)]
+
+# promotion zone of each player
+_zones = {True: row_mask((1, 2, 3)), False: row_mask((_height - 2, _height - 1, _height))}
+
+pawn_kind = kind_of(Pawn(True, (0, 0)))
+
+
+def build_promotion_tables():
+    """
+    creates the tables telling which kinds of piece can promote and where they must
+    :return: tuple containing the set of kinds that can promote, and a dictionary of player to list of
+             bitboards indexed by kind covering the rows the kind must promote on or cannot be dropped on
+    """
+    promotable = set()
+    forced = {}
+    for player in (True, False):
+        forced[player] = []
+        for kind, (cls, promoted) in enumerate(piece_kinds):
+            piece = cls(player, (0, 0))
+            if promoted:
+                piece.promote_piece()
+            if not piece.is_promoted():
+                promotable.add(kind)
+            forced[player].append(row_mask(piece.get_forced_rows()) if not piece.is_promoted() else 0)
+    return promotable, forced
+
+
+_promotable, _forced = build_promotion_tables()
+
+
+def kind_attacks(tables, player, kind, index, occupied):
+    """
+    finds the squares a kind of piece attacks from a square
+    :param tables: _attack_tables, or _reverse_tables to find where the kind could attack the square from
+    :param player: True for player 1, False for player 2
+    :param kind: int index into piece_kinds
+    :param index: int for the square the piece is on
+    :param occupied: int bitboard of all pieces on the board
+    :return: int bitboard of attacked squares
+    """
+    step_table, slides = tables[player][kind]
+    attacks = step_table[index]
+    for direction in slides:
+        # a slide stops at the first piece in the way, so the ray beyond it is taken off
+        ray = _rays[direction]
+        line = ray[index]
+        blockers = line & occupied
+        if blockers:
+            if _ascending[direction]:
+                line ^= ray[(blockers & -blockers).bit_length() - 1]
+            else:
+                line ^= ray[blockers.bit_length() - 1]
+        attacks |= line
+    return attacks
+
+
+def build_slider_kinds():
+    """
+    lists the kinds of piece that can attack a square by sliding from each direction
+    :return: dictionary of player to list of tuples containing the direction from the square, matching
+             _reverse_tables, and the list of kinds sliding from it
+    """
+    sliders = {}
+    for player in (True, False):
+        sliders[player] = []
+        for direction in Game._rays:
+            kinds = [kind for kind in range(len(piece_kinds)) if direction in _reverse_tables[player][kind][1]]
+            if kinds:
+                sliders[player].append((direction, kinds))
+    return sliders
+
+
+_slider_kinds = build_slider_kinds()
+
+
+class BitboardGame(Game):
+    """
+    Game that also keeps the board as integer bitboards, one bit per square, for fast move generation
+    the list of Piece objects is still kept so the rest of the game and the GUI work unchanged
+    """
+
+    def __init__(self, cache_size=None):
+
+        # bitboards of every piece belonging to each player
+        self._occupied = {True: 0, False: 0}
+
+        # bitboards of each kind of piece belonging to each player
+        self._kind_bits = {True: [0] * len(piece_kinds), False: [0] * len(piece_kinds)}
+
+        Game.__init__(self, cache_size)
+
+
+    def set_up_board(self, set_up=None, problem=False):
+        if not Game.set_up_board(self, set_up, problem):
+            return False
+        self.build_bitboards()
+        return True
+
+
+    def build_bitboards(self):
+        """
+        rebuilds all bitboards from the list of pieces on the board
+        :return: None
+        """
+        self._occupied = {True: 0, False: 0}
+        self._kind_bits = {True: [0] * len(piece_kinds), False: [0] * len(piece_kinds)}
+        for index in range(_squares):
+            piece = self._board[index]
+            if piece is not None:
+                self.toggle_bits(piece, index)
+
+
+    def toggle_bits(self, piece, index):
+        """
+        adds a piece to the bitboards if its bit is clear, or removes it if set
+        :param piece: Piece object
+        :param index: int for the square the piece is on
+        :return: None
+        """
+        bit = 1 << index
+        player = piece.get_player()
+        self._occupied[player] ^= bit
+        self._kind_bits[player][kind_of(piece)] ^= bit
+
+
+    def make_move(self, piece, origin, destination, promote=False):
+        taken_piece = self.get_piece_on(destination)
+        if taken_piece:
+            self.toggle_bits(taken_piece, self.stoi(destination))
+        if origin != (0, 0):
+            self.toggle_bits(piece, self.stoi(origin))
+
+        undo_record = Game.make_move(self, piece, origin, destination, promote)
+
+        self.toggle_bits(piece, self.stoi(destination))
+        return undo_record
+
+
+    def unmake_move(self, undo_record):
+        piece, origin, destination = undo_record[:3]
+        taken_piece = undo_record[4]
+        self.toggle_bits(piece, self.stoi(destination))
+
+        Game.unmake_move(self, undo_record)
+
+        if origin != (0, 0):
+            self.toggle_bits(piece, self.stoi(origin))
+        if taken_piece:
+            self.toggle_bits(taken_piece, self.stoi(destination))
+
+
+    def promote_piece(self, piece):
+        index = self.stoi(piece.get_space())
+        self.toggle_bits(piece, index)
+        Game.promote_piece(self, piece)
+        self.toggle_bits(piece, index)
+
+
+    def demote_piece(self, piece, state):
+        index = self.stoi(piece.get_space())
+        self.toggle_bits(piece, index)
+        Game.demote_piece(self, piece, state)
+        self.toggle_bits(piece, index)
+
+
+    def get_player_king(self, player):
+        king_bits = self._kind_bits[player][king_kind]
+        if not king_bits:
+            return None
+        return self._board[king_bits.bit_length() - 1]
+
+
+    def pseudo_possible_moves(self, piece):
+        piece_x, piece_y = piece.get_space()
+        if piece_x == 0 or piece_y == 0:
+            return self.possible_drops(piece)
+        return bits_to_spaces(self.move_bits(piece))
+
+
+    def move_bits(self, piece):
+        """
+        finds the squares a piece on the board can move to, not considering check
+        :param piece: Piece object on the board
+        :return: int bitboard of squares
+        """
+        player = piece.get_player()
+        occupied = self._occupied[True] | self._occupied[False]
+        attacks = kind_attacks(_attack_tables, player, kind_of(piece), index_of(*piece.get_space()), occupied)
+        return attacks & ~self._occupied[player]
+
+
+    def compute_possible_moves(self, piece):
+        """
+        finds spaces a piece can move from its initial position without using the cache
+        forbids putting self in check, testing each move on the bitboards alone
+        :param piece: Piece object to be moved
+        :return: list of tuples representing spaces on the board
+        """
+        player = piece.get_player()
+        origin = piece.get_space()
+        occupied = self._occupied[True] | self._occupied[False]
+
+        if origin == (0, 0):
+            from_bit = 0
+            targets = 0
+            for space in self.possible_drops(piece):
+                targets |= 1 << index_of(*space)
+        else:
+            from_bit = 1 << index_of(*origin)
+            targets = self.move_bits(piece)
+
+        king_bits = self._kind_bits[player][king_kind]
+        if not king_bits:
+            # the attacking player of a mating problem may have no king to leave in check
+            return bits_to_spaces(targets)
+        moving_king = bool(from_bit & king_bits)
+        king_index = king_bits.bit_length() - 1
+
+        legal = 0
+        while targets:
+            to_bit = targets & -targets
+            targets ^= to_bit
+            to_index = to_bit.bit_length() - 1
+            if moving_king:
+                king_index = to_index
+            if not self.attacker_bits(king_index, not player, (occupied & ~from_bit) | to_bit, to_bit):
+                legal |= to_bit
+
+        return bits_to_spaces(legal)
+
+
+    def compute_is_in_check(self, player):
+        if self._attack_map is not None:
+            return Game.compute_is_in_check(self, player)
+        king_bits = self._kind_bits[player][king_kind]
+        if not king_bits:
+            return False
+        return self.attacker_bits(king_bits.bit_length() - 1, not player) != 0
+
+
+    def find_attacker(self, space, player):
+        attackers = self.attacker_bits(index_of(*space), player)
+        if not attackers:
+            return None
+        return self._board[(attackers & -attackers).bit_length() - 1]
+
+
+    def find_attackers(self, space, player):
+        attackers = self.attacker_bits(index_of(*space), player)
+        return [self._board[index_of(*attacker)] for attacker in bits_to_spaces(attackers)]
+
+
+    def attacker_bits(self, index, player, occupied=None, captured=0):
+        """
+        finds every piece of a player attacking a square
+        :param index: int for the square
+        :param player: True for player 1 attackers, False for player 2 attackers
+        :param occupied: int bitboard of all pieces to use instead of the current board
+        :param captured: int bitboard of attacking pieces to ignore because they have been captured
+        :return: int bitboard of attacking pieces
+        """
+        if occupied is None:
+            occupied = self._occupied[True] | self._occupied[False]
+        kind_bits = self._kind_bits[player]
+        tables = _reverse_tables[player]
+        attackers = 0
+        for kind, bits in enumerate(kind_bits):
+            if bits:
+                attackers |= bits & tables[kind][0][index]
+
+        # only the nearest piece in each direction can slide to the square
+        for direction, kinds in _slider_kinds[player]:
+            sliders = 0
+            for kind in kinds:
+                sliders |= kind_bits[kind]
+            if not sliders:
+                continue
+            blockers = _rays[direction][index] & occupied
+            if blockers:
+                if _ascending[direction]:
+                    attackers |= blockers & -blockers & sliders
+                else:
+                    attackers |= 1 << (blockers.bit_length() - 1) & sliders
+        return attackers & ~captured
+
+
+    def legal_moves(self, player, drops=True):
+        """
+        generates every legal move of a player from the bitboards, finding the checking and pinned pieces with
+        masks so only king moves need an attack test
+        :param player: True for player 1, False for player 2
+        :param drops: False to leave out drops
+        :return: generator of tuples as given by Game.legal_moves()
+        """
+        board = self._board
+        own = self._occupied[player]
+        occupied = own | self._occupied[not player]
+        kind_bits = self._kind_bits[player]
+        king_bits = kind_bits[king_kind]
+
+        # squares other pieces may move to, narrowed to capturing or blocking the attacker when in check
+        targets = _full
+        pins = {}
+        if king_bits:
+            king_index = king_bits.bit_length() - 1
+            king = board[king_index]
+            king_space = _spaces[king_index]
+
+            # the king is the only piece that can move into an attack, so its moves are tested directly
+            moves = _attack_tables[player][king_kind][0][king_index] & ~own
+            without_king = occupied ^ king_bits
+            while moves:
+                to_bit = moves & -moves
+                moves ^= to_bit
+                to_index = to_bit.bit_length() - 1
+                if not self.attacker_bits(to_index, not player, without_king | to_bit, to_bit):
+                    yield king, king_space, _spaces[to_index], False
+
+            checkers = self.attacker_bits(king_index, not player, occupied)
+            if checkers:
+                if checkers & (checkers - 1):
+                    return
+                targets = checkers
+                for ray in _rays.values():
+                    if ray[king_index] & checkers:
+                        targets = ray[king_index] ^ ray[checkers.bit_length() - 1]
+                        break
+
+            pins = self.pin_bits(king_index, player, occupied)
+
+        promotable = _promotable
+        zone = _zones[player]
+        forced = _forced[player]
+        for kind, bits in enumerate(kind_bits):
+            if kind == king_kind:
+                continue
+            can_promote = kind in promotable
+            forced_bits = forced[kind]
+            while bits:
+                from_bit = bits & -bits
+                bits ^= from_bit
+                from_index = from_bit.bit_length() - 1
+                piece = board[from_index]
+                origin = _spaces[from_index]
+
+                moves = kind_attacks(_attack_tables, player, kind, from_index, occupied) & ~own & targets
+                if from_index in pins:
+                    moves &= pins[from_index]
+                if not can_promote:
+                    promoting = 0
+                elif from_bit & zone:
+                    promoting = moves
+                else:
+                    promoting = moves & zone
+
+                while moves:
+                    to_bit = moves & -moves
+                    moves ^= to_bit
+                    destination = _spaces[to_bit.bit_length() - 1]
+                    if not to_bit & promoting:
+                        yield piece, origin, destination, False
+                    elif to_bit & forced_bits:
+                        yield piece, origin, destination, True
+                    else:
+                        yield piece, origin, destination, False
+                        yield piece, origin, destination, True
+
+        if not drops:
+            return
+
+        if player:
+            jail = self._p1_jail
+        else:
+            jail = self._p2_jail
+        empty = ~occupied & targets
+        dropped = set()
+        # testing a pawn drop for mate takes the pawn out of the jail and puts it back, so a copy is walked
+        for piece in list(jail):
+            kind = kind_of(piece)
+            if kind in dropped:
+                continue
+            dropped.add(kind)
+            spaces = empty & ~forced[kind]
+            if kind == pawn_kind:
+                spaces &= ~self.pawn_columns(player)
+                spaces &= ~self.pawn_mate_bits(piece, spaces)
+            while spaces:
+                to_bit = spaces & -spaces
+                spaces ^= to_bit
+                yield piece, (0, 0), _spaces[to_bit.bit_length() - 1], False
+
+
+    def pin_bits(self, king_index, player, occupied):
+        """
+        finds the pieces of a player that cannot leave a line without exposing their king to a sliding attacker
+        :param king_index: int for the square of the player's king
+        :param player: True for player 1, False for player 2
+        :param occupied: int bitboard of all pieces on the board
+        :return: dictionary of the index of each pinned piece to the bitboard of the line it may move along
+        """
+        pins = {}
+        own = self._occupied[player]
+        for direction, ray in _rays.items():
+            line = ray[king_index]
+            blockers = line & occupied
+            if not blockers:
+                continue
+            if _ascending[direction]:
+                shield = blockers & -blockers
+                blockers ^= shield
+                pinner = blockers & -blockers
+            else:
+                shield = 1 << (blockers.bit_length() - 1)
+                blockers ^= shield
+                pinner = 1 << (blockers.bit_length() - 1) if blockers else 0
+            if not shield & own or not pinner or pinner & own:
+                continue
+            pinner_index = pinner.bit_length() - 1
+            if (-direction[0], -direction[1]) in _attack_tables[not player][kind_of(self._board[pinner_index])][1]:
+                pins[shield.bit_length() - 1] = line
+        return pins
+
+
+    def pawn_columns(self, player):
+        """
+        finds the columns a player cannot drop a pawn in because they already have an unpromoted pawn there
+        :param player: True for player 1, False for player 2
+        :return: int bitboard of the columns
+        """
+        columns = 0
+        pawns = self._kind_bits[player][pawn_kind]
+        while pawns:
+            low = pawns & -pawns
+            pawns ^= low
+            columns |= _columns[(low.bit_length() - 1) % _width]
+        return columns
+
+
+    def pawn_mate_bits(self, piece, spaces):
+        """
+        finds whether dropping a pawn in front of the enemy king would checkmate, which is not allowed
+        :param piece: Pawn object in a jail
+        :param spaces: int bitboard of the squares the pawn could otherwise be dropped on
+        :return: int bitboard of the square the pawn cannot be dropped on, or 0
+        """
+        player = piece.get_player()
+        enemy_king = self._kind_bits[not player][king_kind]
+        if not enemy_king:
+            return 0
+        king_index = enemy_king.bit_length() - 1
+        check_index = king_index + _width if player else king_index - _width
+        if not 0 <= check_index < _squares or not spaces & (1 << check_index):
+            return 0
+        undo_record = self.make_move(piece, (0, 0), _spaces[check_index])
+        is_checkmated = self.pieces_stuck(not player)
+        self.unmake_move(undo_record)
+        if is_checkmated:
+            return 1 << check_index
+        return 0
+
+
+    def pseudo_possible_drops(self, piece):
+        empty = ~(self._occupied[True] | self._occupied[False]) & _full
+        return bits_to_spaces(empty & ~row_mask(piece.get_forced_rows()))
@@ -0,0 +1,312 @@
+from shogi_files.game import *
+from shogi_files.record import GameRecord, read_errors
+from shogi_files.replay import find_games, replay_record
+from shogi_files.perft import move_to_string
+import argparse
+import mmap
+import random
+import struct
+import sys
+import time
+
+
+# file layout:
+#   header: magic, version, number of slots, number of moves
+#   slots: open-addressed hash table of position key, index of its first move, number of moves
+#   moves: move code, times played, games won by the player making the move, weight for choose()
+_magic = b'SHOGIBK1'
+_version = 1
+_header = struct.Struct('>8sIII')
+_slot = struct.Struct('>QIH2x')
+_entry = struct.Struct('>HIIH')
+
+_squares = 81
+
+# fewest slots per position, so probes stay short
+_load_factor = 2
+
+
+def encode_move(game, move):
+    """
+    packs a move into a small int
+    :param game: Game object the move is made in
+    :param move: tuple as given by Game.legal_moves()
+    :return: int move code
+    """
+    piece, origin, destination, promote = move
+    if origin == (0, 0):
+        start = _squares + kind_of(piece)
+    else:
+        start = game.stoi(origin)
+    return (start * _squares + game.stoi(destination)) * 2 + bool(promote)
+
+
+def piece_reaches(game, piece, origin, destination):
+    """
+    determines if a piece on the board can move to a space by how it moves, with nothing in the way
+    :param game: Game object the piece is in
+    :param piece: Piece object on the board
+    :param origin: tuple containing the space of the piece in format: column, row
+    :param destination: tuple containing board location in format: column, row
+    :return: True if the piece can move to the space, not considering check
+    """
+    diff_x = destination[0] - origin[0]
+    diff_y = destination[1] - origin[1]
+    if (diff_x, diff_y) in Game._jumps:
+        return game.attacks_in_direction(piece, (diff_x, diff_y), 1)
+
+    distance = max(abs(diff_x), abs(diff_y))
+    if not distance or not (diff_x == 0 or diff_y == 0 or abs(diff_x) == abs(diff_y)):
+        return False
+    if not game.attacks_in_direction(piece, (diff_x // distance, diff_y // distance), distance):
+        return False
+    return all(game.get_piece_on(space) is None for space in game.spaces_between(origin, destination))
+
+
+def decode_move(game, code):
+    """
+    unpacks a move code for a position without generating moves, checking only the one move against the rules
+    :param game: Game object in the position the move was made from
+    :param code: int move code as given by encode_move()
+    :return: tuple as given by Game.legal_moves(), or None if the code is not a legal move in the position, e.g. after
+             a key collision or from a stale book
+    """
+    promote = bool(code & 1)
+    start, end = divmod(code >> 1, _squares)
+    destination = game.itos(end)
+
+    player = game.get_turn()
+    if start >= _squares:
+        if player:
+            jail = game.get_p1_jail()
+        else:
+            jail = game.get_p2_jail()
+        pieces = [piece for piece in jail if kind_of(piece) == start - _squares]
+        if not pieces:
+            return None
+        piece = pieces[0]
+        origin = (0, 0)
+        if destination not in game.possible_drops(piece):
+            return None
+    else:
+        origin = game.itos(start)
+        piece = game.get_piece_on(origin)
+        if piece is None or piece.get_player() != player:
+            return None
+        taken_piece = game.get_piece_on(destination)
+        if taken_piece is not None and taken_piece.get_player() == player:
+            return None
+        if not piece_reaches(game, piece, origin, destination):
+            return None
+
+    if promote not in game.promotion_options(piece, origin, destination):
+        return None
+
+    # the move must not leave the player's own king attacked
+    undo_record = game.make_move(piece, origin, destination, promote)
+    in_check = game.compute_is_in_check(player)
+    game.unmake_move(undo_record)
+    if in_check:
+        return None
+    return piece, origin, destination, promote
+
+
+class OpeningBook:
+    """
+    moves played from early positions, read from a book file the first time it is needed
+    """
+
+    def __init__(self, path):
+
+        self._path = path
+        self._file = None
+        self._map = None
+        self._slots = 0
+
+
+    def get_path(self):
+        return self._path
+
+
+    def open(self):
+        """
+        maps the book file into memory
+        :return: None
+        """
+        self._file = open(self._path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, slots, moves = _header.unpack_from(self._map, 0)
+        if magic != _magic or version != _version:
+            self.close()
+            raise ValueError('%s is not an opening book' % self._path)
+        self._slots = slots
+
+
+    def find(self, key):
+        """
+        finds the moves stored for a position key with one hash table probe, plus a few more on collisions
+        :param key: int zobrist key, e.g. from Game.get_key()
+        :return: list of tuples containing the move code, times played, wins, and weight
+        """
+        if self._map is None:
+            self.open()
+        if not self._slots:
+            return []
+
+        moves_start = _header.size + self._slots * _slot.size
+        slot = key % self._slots
+        while True:
+            slot_key, first, count = _slot.unpack_from(self._map, _header.size + slot * _slot.size)
+            if count == 0:
+                return []
+            if slot_key == key:
+                return [_entry.unpack_from(self._map, moves_start + i * _entry.size)
+                        for i in range(first, first + count)]
+            slot = (slot + 1) % self._slots
+
+
+    def moves(self, game):
+        """
+        lists the book moves for a position
+        :param game: Game object
+        :return: list of tuples containing the move as given by Game.legal_moves(), times played, wins, and weight
+        """
+        found = []
+        for code, played, wins, weight in self.find(game.get_key()):
+            move = decode_move(game, code)
+            if move is not None:
+                found.append((move, played, wins, weight))
+        return found
+
+
+    def choose(self, game, rng=random):
+        """
+        picks a book move at random, more often for moves with a higher weight
+        :param game: Game object
+        :param rng: random.Random object
+        :return: tuple as given by Game.legal_moves(), or None if the position is not in the book
+        """
+        found = self.moves(game)
+        if not found:
+            return None
+        return rng.choices([move for move, played, wins, weight in found],
+                           [weight + 1 for move, played, wins, weight in found])[0]
+
+
+    def close(self):
+        """
+        unmaps and closes the book file
+        :return: None
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def count_moves(paths, max_ply=24):
+    """
+    counts the moves played from each early position of recorded games
+    :param paths: iterable of journal file paths
+    :param max_ply: int for the number of moves from the start of each game to count
+    :return: dictionary of position key to dictionary of move code to list of times played and wins
+    """
+    positions = {}
+    game = Game(cache_size=0)
+    for path in paths:
+        # games that cannot be read are left out, python -m shogi_files.replay reports them
+        try:
+            record = GameRecord(path)
+        except read_errors:
+            continue
+        winner = record.get_winner()
+        # the rest of a game with an illegal move is left out
+        for player, key, move in replay_record(record, game, max_ply):
+            code = encode_move(game, move)
+            counts = positions.setdefault(key, {}).setdefault(code, [0, 0])
+            counts[0] += 1
+            if winner == player:
+                counts[1] += 1
+    return positions
+
+
+def write_book(path, positions, min_played=1):
+    """
+    writes an opening book file
+    :param path: path of the book file to create
+    :param positions: dictionary as given by count_moves()
+    :param min_played: int for the fewest times a move must have been played to be kept
+    :return: tuple containing the number of positions and moves written
+    """
+    kept = {}
+    for key, moves in positions.items():
+        moves = {code: counts for code, counts in moves.items() if counts[0] >= min_played}
+        if moves:
+            kept[key] = moves
+
+    slots = [None] * (_load_factor * len(kept) + 1)
+    entries = []
+    for key, moves in kept.items():
+        total = sum(played for played, wins in moves.values())
+        first = len(entries)
+        for code, (played, wins) in sorted(moves.items(), key=lambda item: -item[1][0]):
+            # moves played often and winning often are picked more
+            weight = round(1000 * played / total * (wins + 1) / (played + 2) * 2)
+            entries.append(_entry.pack(code, played, wins, min(weight, 0xffff)))
+
+        slot = key % len(slots)
+        while slots[slot] is not None:
+            slot = (slot + 1) % len(slots)
+        slots[slot] = _slot.pack(key, first, len(entries) - first)
+
+    empty = _slot.pack(0, 0, 0)
+    f = open(path, 'wb')
+    f.write(_header.pack(_magic, _version, len(slots), len(entries)))
+    f.write(b''.join(slot if slot is not None else empty for slot in slots))
+    f.write(b''.join(entries))
+    f.close()
+    return len(kept), len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build or query an opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='build a book from recorded games')
+    build_parser.add_argument('book', help='book file to create')
+    build_parser.add_argument('games', nargs='+', help='journal files or directories of them')
+    build_parser.add_argument('--max-ply', type=int, default=24, help='moves from the start of each game to use')
+    build_parser.add_argument('--min-played', type=int, default=1, help='fewest times a move must be played')
+
+    query_parser = commands.add_parser('query', help='show the book moves of a position')
+    query_parser.add_argument('book', help='book file to read')
+    query_parser.add_argument('position', nargs='?', default=None, help='save file format string or SFEN')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        positions, moves = write_book(args.book, count_moves(find_games(args.games), args.max_ply),
+                                      args.min_played)
+        print('Positions: %d' % positions)
+        print('Moves: %d' % moves)
+        print('Time: %.3fs' % (time.perf_counter() - start))
+        return 0
+
+    game = Game(cache_size=0)
+    if args.position is not None and not (game.from_sfen(args.position) or game.set_up_board(args.position)):
+        print('Position could not be set up')
+        return 1
+    book = OpeningBook(args.book)
+    found = book.moves(game)
+    for move, played, wins, weight in found:
+        print('%-8s played %d  won %d  weight %d' % (move_to_string(move), played, wins, weight))
+    if not found:
+        print('Position is not in the book')
+    book.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
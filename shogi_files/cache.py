@@ -0,0 +1,84 @@
+from collections import OrderedDict
+
+
+class PositionCache:
+    """
+    bounded cache of results about positions, keyed by the zobrist key of the position
+    the least recently used position is dropped once the cache is full
+    """
+
+    def __init__(self, size=1024):
+
+        # most positions to keep, 0 turns the cache off
+        self._size = size
+
+        # zobrist key to dictionary of results for that position, oldest first
+        self._entries = OrderedDict()
+
+        self._hits = 0
+        self._misses = 0
+
+
+    def get_size(self):
+        return self._size
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __deepcopy__(self, memo):
+        # results only depend on the position, so copies of a game can share one cache
+        return self
+
+
+    def lookup(self, key, item):
+        """
+        finds a stored result for a position
+        :param key: int zobrist key of the position
+        :param item: hashable description of the result, e.g. ('check', True)
+        :return: the stored result, or None if it is not in the cache
+        """
+        entry = self._entries.get(key)
+        if entry is not None and item in entry:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[item]
+        self._misses += 1
+        return None
+
+
+    def store(self, key, item, value):
+        """
+        stores a result for a position, dropping the least recently used position if the cache is full
+        :param key: int zobrist key of the position
+        :param item: hashable description of the result
+        :param value: the result, which must not be None
+        :return: None
+        """
+        if self._size <= 0:
+            return
+
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {}
+            self._entries[key] = entry
+            if len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        entry[item] = value
+
+
+    def clear(self):
+        """
+        removes every stored result and resets the hit and miss counters
+        :return: None
+        """
+        self._entries.clear()
+        self._hits = 0
+        self._misses = 0
@@ -0,0 +1,475 @@
+from shogi_files.game import *
+from shogi_files.bitboard import BitboardGame
+from shogi_files.perft import move_to_string
+from shogi_files.book import OpeningBook
+import argparse
+import sys
+import time
+
+
+# value of each kind of piece on the board, indexed like piece_kinds
+board_values = [100, 300, 400, 500, 600, 800, 1000, 0, 600, 600, 600, 600, 1100, 1300]
+
+# pieces in a jail can be dropped anywhere, so they are worth a little more than on the board
+jail_values = [115, 345, 460, 575, 690, 920, 1150, 0]
+
+mate_score = 100000
+
+# scores further from zero than this are mates, counted in plies to the mate
+_mate_bound = mate_score - 1000
+
+# transposition table entry types
+_exact = 0
+_lower = 1
+_upper = 2
+
+# how many nodes to search between checks of the time budget
+_check_interval = 1024
+
+
+def evaluate(game):
+    """
+    scores a position by the material on the board and in each jail
+    :param game: Game object
+    :return: int score from the point of view of the player whose turn it is
+    """
+    score = 0
+    for piece in game.get_board_pieces():
+        if piece.get_player():
+            score += board_values[kind_of(piece)]
+        else:
+            score -= board_values[kind_of(piece)]
+
+    for kind, count in enumerate(game.get_jail_counts(True)):
+        score += jail_values[kind] * count
+    for kind, count in enumerate(game.get_jail_counts(False)):
+        score -= jail_values[kind] * count
+
+    if game.get_turn():
+        return score
+    return -score
+
+
+def score_to_table(score, ply):
+    """
+    converts a mate score counted from the root to one counted from the position being stored, so the entry
+    gives the right distance to mate when the position is reached again at another ply
+    :param score: int score from the search
+    :param ply: int for the number of moves made since the root
+    :return: int score to store
+    """
+    if score > _mate_bound:
+        return score + ply
+    if score < -_mate_bound:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """
+    converts a stored mate score back to one counted from the root, undoing score_to_table()
+    :param score: int score from the transposition table
+    :param ply: int for the number of moves made since the root
+    :return: int score for the search
+    """
+    if score > _mate_bound:
+        return score - ply
+    if score < -_mate_bound:
+        return score + ply
+    return score
+
+
+def move_key(move):
+    """
+    describes a move without the Piece object, so it can be matched in any game with the same position
+    :param move: tuple as given by Game.legal_moves()
+    :return: tuple containing the origin, destination, promotion choice, and kind of the moving piece
+    """
+    piece, origin, destination, promote = move
+    return origin, destination, promote, kind_of(piece)
+
+
+class Engine:
+    """
+    computer player searching the Game move tree with iterative-deepening alpha-beta
+    """
+
+    def __init__(self, max_depth=4, time_limit=None, node_limit=None, table_size=65536, book=None, quiescence=True):
+
+        # deepest search to run, and optional budgets that stop the search early
+        self._max_depth = max_depth
+        self._time_limit = time_limit
+        self._node_limit = node_limit
+
+        # best result found for recently searched positions, shared between searches
+        self._table = PositionCache(table_size)
+
+        # OpeningBook to play from before searching, or None
+        self._book = book
+
+        # True to extend the search through captures past the last ply, False to score the last ply as it stands
+        self._quiescence = quiescence
+
+        # statistics and results of the last search
+        self._nodes = 0
+        self._elapsed = 0.0
+        self._depth = 0
+        self._score = 0
+        self._pv = []
+
+        self._start = 0.0
+        self._stopped = False
+        self._killers = {}
+
+
+    def get_nodes(self):
+        return self._nodes
+
+    def get_elapsed(self):
+        return self._elapsed
+
+    def get_depth(self):
+        return self._depth
+
+    def get_score(self):
+        return self._score
+
+    def get_nps(self):
+        if not self._elapsed:
+            return 0.0
+        return self._nodes / self._elapsed
+
+    def principal_variation(self):
+        return list(self._pv)
+
+
+    def clear_table(self):
+        """
+        forgets every position stored in the transposition table, so the next search does not depend on earlier ones
+        :return: None
+        """
+        self._table.clear()
+
+
+    def best_move(self, game):
+        """
+        plays a book move if there is one, otherwise searches for the best move for the player whose turn it is
+        :param game: Game object, which is left as it was found
+        :return: tuple as given by Game.legal_moves(), or None if there are no legal moves
+        """
+        if self._book is not None:
+            move = self._book.choose(game)
+            if move is not None:
+                self._nodes = 0
+                self._depth = 0
+                self._pv = [move]
+                return move
+
+        self.search(game)
+        if not self._pv:
+            return None
+        return self._pv[0]
+
+
+    def search(self, game):
+        """
+        runs iterative deepening until the maximum depth or a budget is reached
+        results are read with best_move(), principal_variation(), get_score(), and get_nps()
+        :param game: Game object, which is left as it was found
+        :return: int score of the best move from the point of view of the player whose turn it is
+        """
+        self._nodes = 0
+        self._start = time.perf_counter()
+        self._stopped = False
+        self._killers = {}
+        self._depth = 0
+        self._score = 0
+        self._pv = []
+
+        for depth in range(1, self._max_depth + 1):
+            score = self.alpha_beta(game, depth, -mate_score - 1, mate_score + 1, 0)
+            if self._stopped:
+                break
+            self._depth = depth
+            self._score = score
+            self._pv = self.find_pv(game, depth)
+            if abs(score) >= mate_score - self._max_depth:
+                break
+
+        # a search stopped before finishing depth 1 still needs a move to play
+        if not self._pv:
+            moves = list(game.legal_moves(game.get_turn()))
+            if moves:
+                self._pv = [moves[0]]
+
+        self._elapsed = time.perf_counter() - self._start
+        return self._score
+
+
+    def fixed_depth(self, game, depth):
+        """
+        searches a position to exactly the given depth, ignoring the time and node budgets
+        :param game: Game object, which is left as it was found
+        :param depth: int for the number of moves to look ahead
+        :return: int score from the point of view of the player whose turn it is
+        """
+        self._nodes = 0
+        self._start = time.perf_counter()
+        self._stopped = False
+        self._killers = {}
+
+        time_limit, node_limit = self._time_limit, self._node_limit
+        self._time_limit = self._node_limit = None
+        score = self.alpha_beta(game, depth, -mate_score - 1, mate_score + 1, 0)
+        self._time_limit, self._node_limit = time_limit, node_limit
+
+        self._elapsed = time.perf_counter() - self._start
+        return score
+
+
+    def out_of_budget(self):
+        """
+        determines if the search has used up its node or time budget
+        :return: True if the search should stop
+        """
+        if self._node_limit is not None and self._nodes >= self._node_limit:
+            return True
+        if self._time_limit is not None and self._nodes % _check_interval == 0:
+            if time.perf_counter() - self._start >= self._time_limit:
+                return True
+        return False
+
+
+    def alpha_beta(self, game, depth, alpha, beta, ply):
+        """
+        negamax alpha-beta search
+        :param game: Game object, which is left as it was found
+        :param depth: int for the number of moves left to search
+        :param alpha: int lower bound of the score window
+        :param beta: int upper bound of the score window
+        :param ply: int for the number of moves made since the root
+        :return: int score from the point of view of the player whose turn it is
+        """
+        self._nodes += 1
+        if self.out_of_budget():
+            self._stopped = True
+            return 0
+
+        if depth <= 0:
+            if not self._quiescence:
+                return evaluate(game)
+            return self.quiescence(game, alpha, beta, ply)
+
+        key = game.get_key()
+        entry = self._table.lookup(key, 'search')
+        hash_move = None
+        if entry is not None:
+            entry_depth, entry_score, entry_type, hash_move = entry
+            entry_score = score_from_table(entry_score, ply)
+            if entry_depth >= depth and ply > 0:
+                if entry_type == _exact:
+                    return entry_score
+                if entry_type == _lower and entry_score >= beta:
+                    return entry_score
+                if entry_type == _upper and entry_score <= alpha:
+                    return entry_score
+
+        player = game.get_turn()
+        moves = self.order_moves(game, list(game.legal_moves(player)), hash_move, ply)
+        if not moves:
+            # no legal moves is a loss in shogi, sooner losses score lower
+            return -mate_score + ply
+
+        original_alpha = alpha
+        best_score = -mate_score - 1
+        best_key = None
+        for move in moves:
+            undo_record = game.make_move(*move)
+            game.switch_turn()
+            score = -self.alpha_beta(game, depth - 1, -beta, -alpha, ply + 1)
+            game.switch_turn()
+            game.unmake_move(undo_record)
+
+            if self._stopped:
+                return 0
+
+            if score > best_score:
+                best_score = score
+                best_key = move_key(move)
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if game.get_piece_on(move[2]) is None:
+                    self._killers.setdefault(ply, set()).add(move_key(move))
+                break
+
+        if best_score <= original_alpha:
+            entry_type = _upper
+        elif best_score >= beta:
+            entry_type = _lower
+        else:
+            entry_type = _exact
+        self._table.store(key, 'search', (depth, score_to_table(best_score, ply), entry_type, best_key))
+        return best_score
+
+
+    def quiescence(self, game, alpha, beta, ply):
+        """
+        extends the search through captures so positions are not scored in the middle of an exchange
+        :param game: Game object, which is left as it was found
+        :param alpha: int lower bound of the score window
+        :param beta: int upper bound of the score window
+        :param ply: int for the number of moves made since the root
+        :return: int score from the point of view of the player whose turn it is
+        """
+        stand_pat = evaluate(game)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = [move for move in game.legal_moves(game.get_turn(), drops=False)
+                    if game.get_piece_on(move[2]) is not None]
+        for move in self.order_moves(game, captures, None, ply):
+            self._nodes += 1
+            undo_record = game.make_move(*move)
+            game.switch_turn()
+            score = -self.quiescence(game, -beta, -alpha, ply + 1)
+            game.switch_turn()
+            game.unmake_move(undo_record)
+
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+
+        return alpha
+
+
+    def order_moves(self, game, moves, hash_move, ply):
+        """
+        sorts moves so the ones most likely to be best are searched first: the move stored for the position,
+        then captures of valuable pieces by cheap ones, then promotions and killer moves
+        :param game: Game object
+        :param moves: list of tuples as given by Game.legal_moves()
+        :param hash_move: move key of the best move stored for the position, or None
+        :param ply: int for the number of moves made since the root
+        :return: list of the moves in search order
+        """
+        killers = self._killers.get(ply, ())
+
+        def priority(move):
+            piece, origin, destination, promote = move
+            key = move_key(move)
+            if key == hash_move:
+                return 100000
+            score = 0
+            target = game.get_piece_on(destination)
+            if target is not None:
+                score += 10000 + board_values[kind_of(target)] * 10 - board_values[kind_of(piece)] // 10
+            if promote:
+                score += 5000
+            if key in killers:
+                score += 1000
+            return score
+
+        return sorted(moves, key=priority, reverse=True)
+
+
+    def find_pv(self, game, depth):
+        """
+        follows the best moves stored in the transposition table from the current position
+        :param game: Game object, which is left as it was found
+        :param depth: int for the most moves to follow
+        :return: list of tuples as given by Game.legal_moves()
+        """
+        pv = []
+        undo_records = []
+        seen = set()
+        while len(pv) < depth and game.get_key() not in seen:
+            seen.add(game.get_key())
+            entry = self._table.lookup(game.get_key(), 'search')
+            if entry is None or entry[3] is None:
+                break
+            moves = [move for move in game.legal_moves(game.get_turn()) if move_key(move) == entry[3]]
+            if not moves:
+                break
+            pv.append(moves[0])
+            undo_records.append(game.make_move(*moves[0]))
+            game.switch_turn()
+
+        for undo_record in reversed(undo_records):
+            game.switch_turn()
+            game.unmake_move(undo_record)
+        return pv
+
+
+def play_game(game, engines, max_moves=300, out=sys.stdout):
+    """
+    plays a game between two engines, or an engine and itself
+    :param game: Game object to play from
+    :param engines: dictionary of player to the Engine object playing for them
+    :param max_moves: int for the most moves to play before stopping
+    :param out: file to write each move to, or None
+    :return: True if player 1 won, False if player 2 won, None if the game was stopped
+    """
+    for move_num in range(1, max_moves + 1):
+        player = game.get_turn()
+        engine = engines[player]
+        move = engine.best_move(game)
+        if move is None:
+            return not player
+
+        game.make_move(*move)
+        game.switch_turn()
+        if out is not None:
+            out.write('%d. %s  score %d  depth %d  %d nodes  %.0f nodes/s\n'
+                      % (move_num, move_to_string(move), engine.get_score(), engine.get_depth(),
+                         engine.get_nodes(), engine.get_nps()))
+
+        if game.is_in_checkmate(game.get_turn()):
+            return player
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='search a position or play engine against engine')
+    parser.add_argument('-d', '--depth', type=int, default=3, help='deepest search')
+    parser.add_argument('-t', '--time', type=float, default=None, help='seconds allowed per move')
+    parser.add_argument('-n', '--nodes', type=int, default=None, help='nodes allowed per move')
+    parser.add_argument('-p', '--position', default=None, help='save file format string to start from')
+    parser.add_argument('--play', action='store_true', help='play a whole game engine against engine')
+    parser.add_argument('--max-moves', type=int, default=300, help='most moves to play with --play')
+    parser.add_argument('--book', default=None, help='opening book file to play from with --play')
+    args = parser.parse_args(argv)
+
+    game = BitboardGame()
+    if args.position is not None and not game.set_up_board(args.position):
+        print('Position could not be set up')
+        return 1
+
+    if args.play:
+        book = OpeningBook(args.book) if args.book is not None else None
+        engines = {True: Engine(args.depth, args.time, args.nodes, book=book),
+                   False: Engine(args.depth, args.time, args.nodes, book=book)}
+        winner = play_game(game, engines, args.max_moves)
+        print(game)
+        if winner is None:
+            print('No result')
+        else:
+            print('Player %d wins' % (1 if winner else 2))
+        return 0
+
+    engine = Engine(args.depth, args.time, args.nodes)
+    engine.search(game)
+    print('Best move: %s' % ' '.join(move_to_string(move) for move in engine.principal_variation()[:1]))
+    print('Principal variation: %s' % ' '.join(move_to_string(move) for move in engine.principal_variation()))
+    print('Score: %d' % engine.get_score())
+    print('Depth: %d' % engine.get_depth())
+    print('Nodes: %d' % engine.get_nodes())
+    print('Nodes/second: %.0f' % engine.get_nps())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
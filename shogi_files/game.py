@@ -1,5 +1,7 @@
 from shogi_files.pieces import *
-from copy import deepcopy
+from shogi_files.zobrist import *
+from shogi_files.cache import PositionCache
+from shogi_files.save_store import SaveStore
 import os
 
 
@@ -11,8 +13,37 @@ class Game:
                'P.P.P.P.P.P.P.P.P..B......R..L.N.S.G.K.G.S.N.L||'
 
     _save_location = 'shogi_files/saves'
+    _record_location = 'shogi_files/records'
 
-    def __init__(self):
+    # piece class for each letter used in save strings and SFEN
+    _piece_classes = {'k': King,
+                      'r': Rook,
+                      'b': Bishop,
+                      'g': Gold,
+                      's': Silver,
+                      'n': Knight,
+                      'l': Lance,
+                      'p': Pawn}
+
+    # order SFEN lists the pieces held in each jail
+    _sfen_hand_order = 'rbgsnlp'
+
+    # number of each piece in a full set, promoted or not
+    _piece_counts = {'k': 2, 'r': 2, 'b': 2, 'g': 4, 's': 4, 'n': 4, 'l': 4, 'p': 18}
+    _unpromotable = ('k', 'g')
+
+    # rows an unpromoted piece could never move from, for each player
+    _dead_rows = {True: {'p': (1,), 'l': (1,), 'n': (1, 2)},
+                  False: {'p': (9,), 'l': (9,), 'n': (8, 9)}}
+
+    # number of positions to remember legal moves and check status for
+    _cache_size = 1024
+
+    # directions to search outward from a space when looking for attackers
+    _rays = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    _jumps = [(-1, -2), (1, -2), (-1, 2), (1, 2)]
+
+    def __init__(self, cache_size=None):
 
         # True is player 1, False is player 2
         self._turn = True
@@ -26,6 +57,29 @@ class Game:
         self._p1_jail = []
         self._p2_jail = []
 
+        # number of pieces attacking each space for each player, None when not in use
+        self._attack_map = None
+
+        # number of each kind of piece in each jail, indexed by kind
+        self._jail_counts = {True: [], False: []}
+
+        # zobrist key identifying the position, updated as moves are made
+        self._key = 0
+
+        # number of the next move to be made, starting from 1
+        self._move_number = 1
+
+        # GameJournal recording moves as they are played, None when not recording
+        self._journal = None
+
+        # SaveStore of the save directory, opened when first needed
+        self._save_store = None
+
+        # legal moves and check status of recently seen positions
+        if cache_size is None:
+            cache_size = self._cache_size
+        self._cache = PositionCache(cache_size)
+
         # set up pieces in beginning positions
         self.set_up_board()
 
@@ -35,6 +89,28 @@ class Game:
 
     def switch_turn(self):
         self._turn = not self._turn
+        self._key ^= turn_key
+
+    def get_key(self):
+        return self._key
+
+    def get_move_number(self):
+        return self._move_number
+
+    def set_move_number(self, move_number):
+        self._move_number = move_number
+
+    def get_journal(self):
+        return self._journal
+
+    def set_journal(self, journal):
+        self._journal = journal
+
+    def get_record_location(self):
+        return self._record_location
+
+    def get_cache(self):
+        return self._cache
 
     def is_finished(self):
         return self._finished
@@ -45,12 +121,18 @@ class Game:
     def get_board_dims(self):
         return self._width, self._height
 
+    def get_board(self):
+        return self._board
+
     def get_p1_jail(self):
         return self._p1_jail
 
     def get_p2_jail(self):
         return self._p2_jail
 
+    def get_jail_counts(self, player):
+        return self._jail_counts[player]
+
     def __str__(self):
         return self.board_to_strings()
 
@@ -61,29 +143,81 @@ class Game:
         :param piece_string: save file format string
         :return: True if the file string contains a valid piece distribution
         """
-        if piece_string is None:
-            piece_string = self.game_to_strings() + '|1'
-
-        kings = [p for p in piece_string.split('|')[0] if p.lower() == 'k']
-        if not len(kings) == 2 or 'k' not in kings or 'K' not in kings:
-            return False
-
-        if not ('|1' in piece_string or '|2' in piece_string):
-            return False
-
-        piece_string = piece_string[:-2]
+        return self.find_problem(piece_string) is None
 
-        comparison = self._default.replace('.', '').replace('|', '').lower()
-        piece_string = piece_string.replace('.', '').replace('|', '').replace('+', '').lower()
 
-        for p in piece_string:
-            if p not in comparison:
-                return False
-            comparison = comparison.replace(p, '', 1)
+    def find_problem(self, piece_string=None, problem=False):
+        """
+        checks a save file string in one pass over its pieces
+        :param piece_string: save file format string, default is the current game
+        :param problem: True to check a mating problem, which may leave out pieces and the king of the player to move
+        :return: string describing the first problem found in format: problem: details, or None if it is legal
+        """
+        if piece_string is None:
+            piece_string = self.game_to_strings() + '|1'
 
-        if comparison:
-            return False
-        return True
+        sections = piece_string.split('|')
+        if len(sections) != 4:
+            return 'bad format: expected board, two jails, and turn separated by |'
+        board, p1_jail, p2_jail, turn = sections
+
+        if turn not in ('1', '2'):
+            return 'bad turn: ' + repr(turn)
+
+        cells = board.split('.')
+        if len(cells) != self._width * self._height:
+            return 'bad board length: %d spaces' % len(cells)
+
+        counts = dict.fromkeys(self._piece_counts, 0)
+        kings = {True: 0, False: 0}
+        pawn_cols = {True: set(), False: set()}
+
+        for i, cell in enumerate(cells):
+            if cell == '':
+                continue
+            letter = cell[0].lower()
+            if letter not in counts or cell[1:] not in ('', '+'):
+                return 'unknown piece: ' + repr(cell)
+            player = cell[0].isupper()
+            promoted = cell[1:] == '+'
+            counts[letter] += 1
+            col, row = self.itos(i)
+
+            if promoted:
+                if letter in self._unpromotable:
+                    return 'piece cannot be promoted: %s on %d%d' % (cell, col, row)
+                continue
+
+            if letter == 'k':
+                kings[player] += 1
+            elif row in self._dead_rows[player].get(letter, ()):
+                return 'piece can never move: %s on %d%d' % (cell, col, row)
+            elif letter == 'p':
+                if col in pawn_cols[player]:
+                    return 'two pawns in a column: player %d, column %d' % (1 if player else 2, col)
+                pawn_cols[player].add(col)
+
+        for jail in (p1_jail, p2_jail):
+            for cell in jail.split('.'):
+                if cell == '':
+                    continue
+                letter = cell.lower()
+                if letter not in counts or letter == 'k':
+                    return 'piece cannot be in a jail: ' + repr(cell)
+                counts[letter] += 1
+
+        if problem:
+            # only the player being mated needs a king
+            attacker = turn == '1'
+            if kings[not attacker] != 1 or kings[attacker] > 1:
+                return 'bad kings: the player to be mated needs one king on the board, the other at most one'
+        elif kings[True] != 1 or kings[False] != 1:
+            return 'bad kings: each player needs one king on the board'
+
+        for letter, count in counts.items():
+            if count > self._piece_counts[letter] or (count < self._piece_counts[letter] and not problem):
+                return 'wrong number of pieces: %d of %s, expected %d' % (count, letter, self._piece_counts[letter])
+        return None
 
 
     def board_to_strings(self):
@@ -91,113 +225,231 @@ class Game:
         returns string to display board state to console
         :return: string representation of board state
         """
-        board_strings = ''
-        for col in range(self._width):
-            board_strings += '   ' + str(self._width - col) + '  '
-        board_strings += '\n'
-        board_strings += ' -----' * self._width
-        board_strings += '\n'
-        for i in range(len(self._board) - 1):
-            board_strings += '|  '
-            if i % self._width == 0 and i != 0:
-                board_strings += str(i // self._width)
-                board_strings += '\n'
-                board_strings += ' -----' * self._width
-                board_strings += '\n|  '
-            if self._board[i] is None:
-                board_strings += '   '
-            else:
-                board_strings += self._board[i].get_sym().ljust(3)
-        board_strings += '|  ' + str(self._height) + '\n'
-        board_strings += ' -----' * self._width
+        rule = ' -----' * self._width
+        lines = [''.join(['   ' + str(self._width - col) + '  ' for col in range(self._width)]), rule]
+        for row in range(self._height):
+            cells = self._board[row * self._width:(row + 1) * self._width]
+            lines.append(''.join(['|     ' if piece is None else '|  ' + piece.get_sym().ljust(3) for piece in cells])
+                         + '|  ' + str(row + 1))
+            lines.append(rule)
+        board_strings = '\n'.join(lines)
         return board_strings
 
 
-    def set_up_board(self, set_up=None):
+    def set_up_board(self, set_up=None, problem=False):
         """
         sets up the board with pieces in specified state, default is starting positions
         :param set_up: set up for game if given
+        :param problem: True to set up a mating problem, see find_problem()
         :return: True if game set up is successful
         """
-        piece_dict = {'k': King,
-                      'r': Rook,
-                      'b': Bishop,
-                      'g': Gold,
-                      's': Silver,
-                      'n': Knight,
-                      'l': Lance,
-                      'p': Pawn}
-
         if set_up is None:
             set_up = self._default + '|1'
 
-        if not self.is_legal_game(set_up):
+        if self.find_problem(set_up, problem) is not None:
             return False
 
         set_up = set_up.split('|')
         board = set_up[0].split('.')
 
-        if len(board) > 81:
-            return False
-
         self._board = [None] * (self._width * self._height + 1)
         self._p1_jail = []
         self._p2_jail = []
 
         for i, piece in enumerate(board):
             if piece != '':
-                self._board[i] = piece_dict[piece[0].lower()](piece[0].isupper(), self.itos(i))
+                self._board[i] = self._piece_classes[piece[0].lower()](piece[0].isupper(), self.itos(i))
                 if '+' in piece:
                     self._board[i].promote_piece()
 
         p1_j = set_up[1].split('.')
         for j, piece in enumerate(p1_j):
             if piece != '':
-                self._p1_jail.append(piece_dict[piece[0].lower()](True, (0, 0)))
+                self._p1_jail.append(self._piece_classes[piece[0].lower()](True, (0, 0)))
 
         p2_j = set_up[2].split('.')
         for k, piece in enumerate(p2_j):
             if piece != '':
-                self._p2_jail.append(piece_dict[piece[0].lower()](False, (0, 0)))
+                self._p2_jail.append(self._piece_classes[piece[0].lower()](False, (0, 0)))
 
         self._turn = set_up[3] == '1'
 
+        self._jail_counts = self.count_jail_kinds()
+        self._key = self.compute_key()
+        self._move_number = 1
+
+        if self._attack_map is not None:
+            self.use_attack_map()
+
         return True
 
 
+    def count_jail_kinds(self):
+        """
+        counts how many of each kind of piece are in each jail
+        :return: dictionary of player to list of counts indexed by kind
+        """
+        counts = {True: [0] * len(jail_keys[True]), False: [0] * len(jail_keys[False])}
+        for player, jail in ((True, self._p1_jail), (False, self._p2_jail)):
+            for piece in jail:
+                counts[player][kind_of(piece)] += 1
+        return counts
+
+
+    def compute_key(self):
+        """
+        calculates the zobrist key of the position from scratch
+        :return: int 64-bit key covering the pieces on the board, the number of each kind of piece
+                 in each jail, and whose turn it is
+        """
+        key = 0
+        for index in range(self._width * self._height):
+            piece = self._board[index]
+            if piece is not None:
+                key ^= piece_keys[piece.get_player()][kind_of(piece)][index]
+
+        counts = self.count_jail_kinds()
+        for player in (True, False):
+            for kind, count in enumerate(counts[player]):
+                key ^= jail_keys[player][kind][count]
+
+        if not self._turn:
+            key ^= turn_key
+        return key
+
+
     def game_to_strings(self):
         """
         converts game information into a string
         :return: string containing board pieces and jail pieces deliminated by a period, with board
                  information and the two jails information separated by |
         """
-        board = self.board_to_strings()
-        board = board.replace(' |', '.')
-        board = board.replace(' ', '').replace('-', '').replace('\n', '').replace('|', '')
-        board = ''.join([i for i in board if not i.isdigit()])
+        board = self._board
+        cells = ['' if board[i] is None else board[i].get_sym() for i in range(self._width * self._height)]
 
-        p1_j = ''
-        for piece in self._p1_jail:
-            p1_j += piece.get_sym() + '.'
-        p2_j = ''
-        for piece in self._p2_jail:
-            p2_j += piece.get_sym() + '.'
+        p1_j = ''.join([piece.get_sym() + '.' for piece in self._p1_jail])
+        p2_j = ''.join([piece.get_sym() + '.' for piece in self._p2_jail])
 
-        return board[:-1] + '|' + p1_j + '|' + p2_j
+        return '.'.join(cells) + '|' + p1_j + '|' + p2_j
 
 
-    def save_game(self):
+    def to_sfen(self, move_number=None):
         """
-        saves game information including player turn in a file that it creates
-        :return: int for the save file number
+        converts the position to SFEN, the standard format used by other shogi programs
+        :param move_number: int for the move number written at the end of the SFEN, default is the game's
+        :return: SFEN string, e.g. lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1
         """
-        if not os.path.isdir(self._save_location):
-            os.mkdir(self._save_location)
+        if move_number is None:
+            move_number = self._move_number
+
+        rows = []
+        for row in range(self._height):
+            row_str = ''
+            empty = 0
+            for piece in self._board[row * self._width:(row + 1) * self._width]:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row_str += str(empty)
+                    empty = 0
+                sym = piece.get_sym()
+                if sym[-1] == '+':
+                    sym = '+' + sym[0]
+                row_str += sym
+            if empty:
+                row_str += str(empty)
+            rows.append(row_str)
+
+        hand = ''
+        for player, jail in ((True, self._p1_jail), (False, self._p2_jail)):
+            for letter in self._sfen_hand_order:
+                count = len([piece for piece in jail if piece.get_sym().lower() == letter])
+                if count > 1:
+                    hand += str(count)
+                if count:
+                    hand += letter.upper() if player else letter
+
+        turn = 'b' if self._turn else 'w'
+        return '/'.join(rows) + ' ' + turn + ' ' + (hand or '-') + ' ' + str(move_number)
+
+
+    def from_sfen(self, sfen, problem=False):
+        """
+        sets up the board from an SFEN string
+        :param sfen: SFEN string, the move number at the end may be left off
+        :param problem: True to set up a mating problem, see find_problem()
+        :return: True if game set up is successful
+        """
+        fields = sfen.split()
+        if len(fields) not in (3, 4):
+            return False
+        rows, turn, hand = fields[:3]
+
+        if turn not in ('b', 'w'):
+            return False
+
+        cells = []
+        for row_str in rows.split('/'):
+            row_cells = []
+            promoted = False
+            for char in row_str:
+                if char.isdigit():
+                    row_cells += [''] * int(char)
+                elif char == '+':
+                    promoted = True
+                elif char.lower() in self._piece_classes:
+                    row_cells.append(char + '+' if promoted else char)
+                    promoted = False
+                else:
+                    return False
+            if len(row_cells) != self._width or promoted:
+                return False
+            cells += row_cells
+        if len(cells) != self._width * self._height:
+            return False
+
+        jails = {True: '', False: ''}
+        if hand != '-':
+            count = ''
+            for char in hand:
+                if char.isdigit():
+                    count += char
+                elif char.lower() in self._piece_classes:
+                    jails[char.isupper()] += (char + '.') * int(count or 1)
+                    count = ''
+                else:
+                    return False
+            # a count must be followed by the piece it counts
+            if count:
+                return False
+
+        if len(fields) == 4 and not fields[3].isdigit():
+            return False
+
+        if not self.set_up_board('.'.join(cells) + '|' + jails[True] + '|' + jails[False] + '|'
+                                 + ('1' if turn == 'b' else '2'), problem):
+            return False
+        if len(fields) == 4:
+            self._move_number = int(fields[3])
+        return True
 
-        save_num = 1
-        while os.path.isfile(self._save_location + '/shogi_save' + str(save_num) + '.txt'):
-            save_num += 1
 
+    def get_save_store(self):
+        """
+        gives the index of saved games in the save directory
+        :return: SaveStore object
+        """
+        if self._save_store is None:
+            self._save_store = SaveStore(self._save_location)
+        return self._save_store
+
+
+    def save_game(self):
+        """
+        saves game information including player turn, indexed with the move number and time saved
+        :return: int for the save number
+        """
         if self._turn:
             turn = '1'
         else:
@@ -205,10 +457,24 @@ class Game:
 
         save_str = self.game_to_strings() + '|' + turn
 
-        f = open(self._save_location + '/shogi_save' + str(save_num) + '.txt', 'w')
-        f.write(save_str)
-        f.close()
-        return save_num
+        return self.get_save_store().add(save_str, self._turn, self._move_number)
+
+
+    def load_save(self, save_num):
+        """
+        loads a game saved by save_game()
+        :param save_num: int for the save number
+        :return: True if game set up is successful
+        """
+        save = self.get_save_store().get(save_num)
+        if save is None:
+            return False
+
+        save_str, move_number = save
+        if not self.set_up_board(save_str):
+            return False
+        self._move_number = move_number
+        return True
 
 
     def load_game(self, save_file_path):
@@ -222,14 +488,10 @@ class Game:
         if not os.path.isfile(save_file_path):
             return False
 
-        permitted_chars = '.krbgsnlp|+12'
         f = open(save_file_path, 'r')
         save_file = f.read()
         f.close()
 
-        if [i for i in save_file.lower() if i not in permitted_chars]:
-            return False
-
         return self.set_up_board(save_file)
 
 
@@ -304,9 +566,8 @@ class Game:
         :param player: True for player 1, False for player 2
         :return: King object belonging to the specified player
         """
-        team = self.get_player_team(player)
-        for piece in team:
-            if 'king' in piece.get_name():
+        for piece in self._board:
+            if isinstance(piece, King) and piece.get_player() == player:
                 return piece
 
 
@@ -352,6 +613,7 @@ class Game:
             return self.possible_drops(piece)
 
         directions = piece.get_dirs()
+        player = piece.get_player()
 
         for dir_set in directions:
             for x, y in dir_set[0]:
@@ -361,15 +623,15 @@ class Game:
 
                 while self.on_board((pos_x, pos_y)) and dist_limit != 0:
                     dist_limit -= 1
-                    piece_on_space = self.get_piece_on((pos_x, pos_y))
+                    piece_on_space = self._board[self.stoi((pos_x, pos_y))]
 
                     if piece_on_space is None:
-                        move_list.append(tuple([pos_x, pos_y]))
-                    elif piece_on_space.get_player() == piece.get_player():
+                        move_list.append((pos_x, pos_y))
+                    elif piece_on_space.get_player() == player:
                         dist_limit = 0
                     else:
                         dist_limit = 0
-                        move_list.append(tuple([pos_x, pos_y]))
+                        move_list.append((pos_x, pos_y))
 
                     pos_x += x
                     pos_y += y
@@ -379,23 +641,199 @@ class Game:
 
     def is_in_check(self, player):
         """
-        determines if a given player is in check
+        determines if a given player is in check, using the cache if the position was seen recently
         :param player: True for player 1, False for player 2
         :return: True if the given player is in check, False otherwise
         """
-        pieces = self.get_player_team(not player)
-        space = self.get_player_king(player).get_space()
+        in_check = self._cache.lookup(self._key, ('check', player))
+        if in_check is None:
+            in_check = self.compute_is_in_check(player)
+            self._cache.store(self._key, ('check', player), in_check)
+        return in_check
 
-        for piece in pieces:
-            if space in self.pseudo_possible_moves(piece):
-                return True
 
+    def compute_is_in_check(self, player):
+        """
+        determines if a given player is in check without using the cache
+        :param player: True for player 1, False for player 2
+        :return: True if the given player is in check, False otherwise
+        """
+        king = self.get_player_king(player)
+        if king is None:
+            # the attacking player of a mating problem may have no king
+            return False
+        space = king.get_space()
+
+        if self._attack_map is not None:
+            return self._attack_map[not player][self.stoi(space)] > 0
+
+        return self.find_attacker(space, not player) is not None
+
+
+    def attacks_in_direction(self, piece, direction, distance):
+        """
+        determines if a piece can reach a space in a given direction and distance away from it
+        :param piece: Piece object
+        :param direction: tuple containing the step the piece would take in format: column, row
+        :param distance: int for the number of steps to the space
+        :return: True if the piece can reach the space when nothing is in the way
+        """
+        for dir_set in piece.get_dirs():
+            if direction in dir_set[0] and (dir_set[1] == -1 or distance <= dir_set[1]):
+                return True
         return False
 
 
+    def find_attacker(self, space, player):
+        """
+        finds a piece attacking a space by searching outward from the space
+        stops at the first attacker found
+        :param space: tuple containing board location in format: column, row
+        :param player: True to look for player 1 attackers, False for player 2 attackers
+        :return: Piece object attacking the space, None if there is no attacker
+        """
+        col, row = space
+
+        for x, y in self._jumps:
+            pos = (col + x, row + y)
+            if self.on_board(pos):
+                piece = self._board[self.stoi(pos)]
+                if piece is not None and piece.get_player() == player \
+                        and self.attacks_in_direction(piece, (-x, -y), 1):
+                    return piece
+
+        for piece, direction, distance in self.ray_pieces(space):
+            if piece.get_player() == player and self.attacks_in_direction(piece, direction, distance):
+                return piece
+
+        return None
+
+
+    def ray_pieces(self, space):
+        """
+        finds the nearest piece in each straight or diagonal line outward from a space
+        :param space: tuple containing board location in format: column, row
+        :return: list of tuples containing a Piece object, the direction it would travel to reach
+                 the space, and how many steps away it is
+        """
+        found = []
+        col, row = space
+        for x, y in self._rays:
+            pos_x = col + x
+            pos_y = row + y
+            distance = 1
+            while self.on_board((pos_x, pos_y)):
+                piece = self._board[self.stoi((pos_x, pos_y))]
+                if piece is not None:
+                    found.append((piece, (-x, -y), distance))
+                    break
+                pos_x += x
+                pos_y += y
+                distance += 1
+        return found
+
+
+    def attacked_spaces(self, piece):
+        """
+        finds the spaces a piece on the board attacks, including spaces holding pieces of its own team
+        :param piece: Piece object on the board
+        :return: list of tuples representing spaces on the board
+        """
+        attack_list = []
+
+        piece_x, piece_y = piece.get_space()
+        for dir_set in piece.get_dirs():
+            for x, y in dir_set[0]:
+                pos_x = piece_x + x
+                pos_y = piece_y + y
+                dist_limit = dir_set[1]
+
+                while self.on_board((pos_x, pos_y)) and dist_limit != 0:
+                    dist_limit -= 1
+                    attack_list.append((pos_x, pos_y))
+                    if self._board[self.stoi((pos_x, pos_y))] is not None:
+                        dist_limit = 0
+
+                    pos_x += x
+                    pos_y += y
+
+        return attack_list
+
+
+    def use_attack_map(self, enabled=True):
+        """
+        turns on or off a cached count of the attackers on every space, which is kept up to date as
+        moves are made and makes is_in_check() a single lookup
+        :param enabled: True to build the attack map, False to stop using it
+        :return: None
+        """
+        if not enabled:
+            self._attack_map = None
+            return
+
+        self._attack_map = {True: [0] * len(self._board), False: [0] * len(self._board)}
+        self.update_attack_map(self.get_board_pieces(), 1)
+
+
+    def update_attack_map(self, pieces, change):
+        """
+        adds or removes the attacks of pieces on the board from the attack map
+        :param pieces: iterable of Piece objects
+        :param change: 1 to add the attacks, -1 to remove them
+        :return: None
+        """
+        for piece in pieces:
+            if piece.get_space() == (0, 0):
+                continue
+            counts = self._attack_map[piece.get_player()]
+            for space in self.attacked_spaces(piece):
+                counts[self.stoi(space)] += change
+
+
+    def affected_attackers(self, piece, origin, destination, taken_piece):
+        """
+        finds the pieces whose attacks can change when a piece moves between two spaces
+        :param piece: Piece object being moved
+        :param origin: tuple containing piece origin location in format: column, row
+        :param destination: tuple containing piece destination location in format: column, row
+        :param taken_piece: Piece object on the destination, or None
+        :return: set of Piece objects
+        """
+        affected = {piece}
+        if taken_piece is not None:
+            affected.add(taken_piece)
+        for space in (origin, destination):
+            if self.on_board(space):
+                for other, direction, distance in self.ray_pieces(space):
+                    # only pieces that slide through the space can have their attacks blocked or opened
+                    if self.attacks_in_direction(other, direction, self._width):
+                        affected.add(other)
+        return affected
+
+
     def possible_moves(self, piece):
         """
-        finds spaces a piece can move from its initial position
+        finds spaces a piece can move from its initial position, using the cache if the position was seen recently
+        forbids putting self in check by moving a piece blocking an attack
+        :param piece: Piece object to be moved
+        :return: list of tuples representing spaces on the board
+        """
+        origin = piece.get_space()
+        if origin == (0, 0):
+            item = ('drops', piece.get_player(), kind_of(piece))
+        else:
+            item = ('moves', origin)
+
+        move_list = self._cache.lookup(self._key, item)
+        if move_list is None:
+            move_list = self.compute_possible_moves(piece)
+            self._cache.store(self._key, item, move_list)
+        return list(move_list)
+
+
+    def compute_possible_moves(self, piece):
+        """
+        finds spaces a piece can move from its initial position without using the cache
         forbids putting self in check by moving a piece blocking an attack
         :param piece: Piece object to be moved
         :return: list of tuples representing spaces on the board
@@ -403,17 +841,13 @@ class Game:
         pseudo_move_list = self.pseudo_possible_moves(piece)
         move_list = []
 
+        origin = piece.get_space()
+        player = piece.get_player()
         for move in pseudo_move_list:
-            tmp = deepcopy(self)
-            if piece.get_space() == (0, 0):
-                if piece.get_player():
-                    tmp.move_piece(tmp._p1_jail[self._p1_jail.index(piece)], move)
-                else:
-                    tmp.move_piece(tmp._p2_jail[self._p2_jail.index(piece)], move)
-            else:
-                tmp.move_from_space(piece.get_space(), move)
-            if not tmp.is_in_check(piece.get_player()):
+            undo_record = self.make_move(piece, origin, move)
+            if not self.compute_is_in_check(player):
                 move_list.append(move)
+            self.unmake_move(undo_record)
 
         return move_list
 
@@ -424,44 +858,201 @@ class Game:
         :param player: True for player 1, False for player 2
         :return: True if king of specified player is stuck
         """
-        for piece in self.get_player_team(player):
-            if self.possible_moves(piece):
-                return False
+        for move in self.legal_moves(player, drops=False):
+            return False
 
         return True
 
 
+    def legal_moves(self, player, drops=True):
+        """
+        generates every legal move of a player, finding the pieces giving check and the pinned pieces only once
+        :param player: True for player 1, False for player 2
+        :param drops: False to leave out drops
+        :return: generator of tuples containing the Piece object, its origin, its destination, and whether
+                 it promotes, with each promotion choice as its own move and drops of the same kind of
+                 piece only given once
+        """
+        king = self.get_player_king(player)
+        if king is None:
+            # the attacking player of a mating problem may have no king, so nothing is in check or pinned
+            king_space = None
+            checkers = []
+            pins = {}
+        else:
+            king_space = king.get_space()
+            checkers = self.find_attackers(king_space, not player)
+            pins = self.find_pins(king_space, player)
+
+        # the king is the only piece that can move into an attack, so its moves are tested directly
+        for destination in self.pseudo_possible_moves(king) if king is not None else []:
+            undo_record = self.make_move(king, king_space, destination)
+            safe = not self.compute_is_in_check(player)
+            self.unmake_move(undo_record)
+            if safe:
+                yield king, king_space, destination, False
+
+        if len(checkers) > 1:
+            return
+
+        # when in check, other pieces must capture the attacker or block it
+        targets = None
+        if checkers:
+            checker_space = checkers[0].get_space()
+            targets = set(self.spaces_between(king_space, checker_space))
+            targets.add(checker_space)
+
+        for piece in self.get_player_team(player):
+            if piece is king:
+                continue
+            origin = piece.get_space()
+            pin = pins.get(piece)
+            for destination in self.pseudo_possible_moves(piece):
+                if targets is not None and destination not in targets:
+                    continue
+                if pin is not None and not self.on_line(king_space, pin, destination):
+                    continue
+                for promote in self.promotion_options(piece, origin, destination):
+                    yield piece, origin, destination, promote
+
+        if not drops:
+            return
+
+        if player:
+            jail = self._p1_jail
+        else:
+            jail = self._p2_jail
+        dropped = set()
+        for piece in jail:
+            kind = kind_of(piece)
+            if kind in dropped:
+                continue
+            dropped.add(kind)
+            for destination in self.possible_drops(piece):
+                if targets is None or destination in targets:
+                    yield piece, (0, 0), destination, False
+
+
+    def find_attackers(self, space, player):
+        """
+        finds every piece attacking a space
+        :param space: tuple containing board location in format: column, row
+        :param player: True to look for player 1 attackers, False for player 2 attackers
+        :return: list of Piece objects attacking the space
+        """
+        attackers = []
+        col, row = space
+
+        for x, y in self._jumps:
+            pos = (col + x, row + y)
+            if self.on_board(pos):
+                piece = self._board[self.stoi(pos)]
+                if piece is not None and piece.get_player() == player \
+                        and self.attacks_in_direction(piece, (-x, -y), 1):
+                    attackers.append(piece)
+
+        for piece, direction, distance in self.ray_pieces(space):
+            if piece.get_player() == player and self.attacks_in_direction(piece, direction, distance):
+                attackers.append(piece)
+
+        return attackers
+
+
+    def find_pins(self, space, player):
+        """
+        finds the pieces of a player that cannot leave a line without exposing a space to a sliding attacker
+        :param space: tuple containing board location in format: column, row, usually of the player's king
+        :param player: True for player 1, False for player 2
+        :return: dictionary of pinned Piece object to the direction from the space towards it
+        """
+        pins = {}
+        col, row = space
+        for x, y in self._rays:
+            pos_x = col + x
+            pos_y = row + y
+            distance = 1
+            shield = None
+            while self.on_board((pos_x, pos_y)):
+                piece = self._board[self.stoi((pos_x, pos_y))]
+                if piece is not None:
+                    if shield is not None:
+                        if piece.get_player() != player and self.attacks_in_direction(piece, (-x, -y), distance):
+                            pins[shield] = (x, y)
+                        break
+                    if piece.get_player() != player:
+                        break
+                    shield = piece
+                pos_x += x
+                pos_y += y
+                distance += 1
+        return pins
+
+
+    def spaces_between(self, start, end):
+        """
+        finds the spaces strictly between two spaces on the same straight or diagonal line
+        :param start: tuple containing board location in format: column, row
+        :param end: tuple containing board location in format: column, row
+        :return: list of tuples representing spaces on the board, empty if the spaces are not on a line
+        """
+        diff_x = end[0] - start[0]
+        diff_y = end[1] - start[1]
+        if not (diff_x == 0 or diff_y == 0 or abs(diff_x) == abs(diff_y)):
+            return []
+
+        step_x = (diff_x > 0) - (diff_x < 0)
+        step_y = (diff_y > 0) - (diff_y < 0)
+        spaces = []
+        pos_x = start[0] + step_x
+        pos_y = start[1] + step_y
+        while (pos_x, pos_y) != end:
+            spaces.append((pos_x, pos_y))
+            pos_x += step_x
+            pos_y += step_y
+        return spaces
+
+
+    def on_line(self, start, direction, space):
+        """
+        determines if a space lies on the line leaving a starting space in a given direction
+        :param start: tuple containing board location in format: column, row
+        :param direction: tuple containing the step along the line in format: column, row
+        :param space: tuple containing board location in format: column, row
+        :return: True if the space is on the line
+        """
+        diff_x = space[0] - start[0]
+        diff_y = space[1] - start[1]
+        return diff_x * direction[1] == diff_y * direction[0] and diff_x * direction[0] + diff_y * direction[1] > 0
+
+
     def is_in_checkmate(self, player):
         """
-        determines if a player is in checkmate
+        determines if a player is in checkmate, using the cache if the position was seen recently
+        :param player: True for player 1, False for player 2
+        :return: True if player is in checkmate
+        """
+        checkmate = self._cache.lookup(self._key, ('checkmate', player))
+        if checkmate is None:
+            checkmate = self.compute_is_in_checkmate(player)
+            self._cache.store(self._key, ('checkmate', player), checkmate)
+        if checkmate:
+            self._finished = True
+        return checkmate
+
+
+    def compute_is_in_checkmate(self, player):
+        """
+        determines if a player is in checkmate without using the cache
         :param player: True for player 1, False for player 2
         :return: True if player is in checkmate
         """
         if not self.is_in_check(player):
             return False
 
-        if (player and self._p1_jail) or (not player and self._p2_jail):
-            player_king = self.get_player_king(player)
-            king_col, king_row = player_king.get_space()
-            open_adj = []
-            for x in range(-1, 2):
-                for y in range(-1, 2):
-                    space = (king_col + x, king_row + y)
-                    if self.get_piece_on(space) is None:
-                        open_adj.append(space)
-
-            for space in open_adj:
-                tmp = deepcopy(self)
-                tmp_piece = Pawn(player, (10, 10))
-                tmp.move_piece(tmp_piece, space)
-                if not tmp.is_in_check(player):
-                    return False
-
+        for move in self.legal_moves(player):
+            return False
 
-        if self.pieces_stuck(player):
-            self._finished = True
-            return True
-        return False
+        return True
 
 
     def move_piece(self, piece, destination):
@@ -469,10 +1060,12 @@ class Game:
         used to move a given piece to a destination space
         :param piece: Piece object
         :param destination: tuple containing piece destination location in format: column, row
-        :return: None
+        :return: undo record, see make_move()
         """
         origin = piece.get_space()
-        self.make_move(piece, origin, destination)
+        if self._journal is not None:
+            self._journal.record_move(self, piece, origin, destination)
+        return self.make_move(piece, origin, destination)
 
 
     def move_from_space(self, origin, destination):
@@ -480,38 +1073,179 @@ class Game:
         used to move a piece on a given space to a destination space
         :param origin: tuple containing piece origin location in format: column, row
         :param destination: tuple containing piece destination location in format: column, row
-        :return: None
+        :return: undo record, see make_move()
         """
         piece = self.get_piece_on(origin)
-        self.make_move(piece, origin, destination)
+        if self._journal is not None:
+            self._journal.record_move(self, piece, origin, destination)
+        return self.make_move(piece, origin, destination)
 
 
-    def make_move(self, piece, origin, destination):
+    def make_move(self, piece, origin, destination, promote=False):
         """
         moves a piece from an initial position to its destination
         :param piece: Piece object to be moved
         :param origin: tuple containing piece origin location in format: column, row
         :param destination: tuple containing piece destination location in format: column, row
-        :return: None
+        :param promote: True to promote the piece as part of the move
+        :return: undo record to pass to unmake_move(), a tuple containing the moved piece, its origin,
+                 its destination, its index in the jail if it was dropped, the captured piece, the
+                 state of the captured piece before it was captured, the state of the moved piece
+                 before it was promoted, and the zobrist key before the move
         """
         taken_piece = self.get_piece_on(destination)
+        player = piece.get_player()
+        old_key = self._key
+        key = old_key
+        counts = self._jail_counts[player]
+
+        if self._attack_map is not None:
+            affected = self.affected_attackers(piece, origin, destination, taken_piece)
+            self.update_attack_map(affected, -1)
+
+        taken_state = None
         if taken_piece:
+            taken_state = taken_piece.get_state()
+            key ^= piece_keys[taken_piece.get_player()][kind_of(taken_piece)][self.stoi(destination)]
             taken_piece.got_captured()
+            kind = kind_of(taken_piece)
+            key ^= jail_keys[player][kind][counts[kind]] ^ jail_keys[player][kind][counts[kind] + 1]
+            counts[kind] += 1
             if piece.get_player():
                 self._p1_jail.append(taken_piece)
             else:
                 self._p2_jail.append(taken_piece)
 
+        jail_index = None
         if origin == (0, 0):
+            kind = kind_of(piece)
+            key ^= jail_keys[player][kind][counts[kind]] ^ jail_keys[player][kind][counts[kind] - 1]
+            counts[kind] -= 1
             if piece.get_player():
-                self._p1_jail.remove(piece)
+                jail_index = self._p1_jail.index(piece)
+                del self._p1_jail[jail_index]
             else:
-                self._p2_jail.remove(piece)
+                jail_index = self._p2_jail.index(piece)
+                del self._p2_jail[jail_index]
         else:
+            key ^= piece_keys[player][kind_of(piece)][self.stoi(origin)]
             self._board[self.stoi(origin)] = None
         piece.set_space(destination)
         self._board[self.stoi(destination)] = piece
 
+        piece_state = None
+        if promote:
+            piece_state = piece.get_state()
+            piece.promote_piece()
+
+        key ^= piece_keys[player][kind_of(piece)][self.stoi(destination)]
+        self._key = key
+        self._move_number += 1
+
+        if self._attack_map is not None:
+            self.update_attack_map(affected, 1)
+
+        return piece, origin, destination, jail_index, taken_piece, taken_state, piece_state, old_key
+
+
+    def unmake_move(self, undo_record):
+        """
+        takes back a move made by make_move(), restoring the game exactly as it was before
+        :param undo_record: tuple returned by make_move()
+        :return: None
+        """
+        piece, origin, destination, jail_index, taken_piece, taken_state, piece_state, old_key = undo_record
+        counts = self._jail_counts[piece.get_player()]
+
+        if self._attack_map is not None:
+            affected = self.affected_attackers(piece, origin, destination, None)
+            self.update_attack_map(affected, -1)
+
+        if piece.get_player():
+            jail = self._p1_jail
+        else:
+            jail = self._p2_jail
+
+        self._board[self.stoi(destination)] = taken_piece
+        if taken_piece:
+            jail.pop()
+            counts[kind_of(taken_piece)] -= 1
+            taken_piece.set_state(taken_state)
+
+        if origin == (0, 0):
+            jail.insert(jail_index, piece)
+            counts[kind_of(piece)] += 1
+        else:
+            self._board[self.stoi(origin)] = piece
+        if piece_state is not None:
+            piece.set_state(piece_state)
+        piece.set_space(origin)
+        self._key = old_key
+        self._move_number -= 1
+
+        if self._attack_map is not None:
+            if taken_piece:
+                affected.add(taken_piece)
+            self.update_attack_map(affected, 1)
+
+
+    def promote_piece(self, piece):
+        """
+        promotes a piece while keeping anything the game tracks about the piece up to date
+        :param piece: Piece object to be promoted
+        :return: None
+        """
+        if self._attack_map is not None:
+            self.update_attack_map([piece], -1)
+
+        index = self.stoi(piece.get_space())
+        self._key ^= piece_keys[piece.get_player()][kind_of(piece)][index]
+        piece.promote_piece()
+        self._key ^= piece_keys[piece.get_player()][kind_of(piece)][index]
+
+        if self._attack_map is not None:
+            self.update_attack_map([piece], 1)
+
+        if self._journal is not None:
+            self._journal.record_promotion(piece.get_space())
+
+
+    def demote_piece(self, piece, state):
+        """
+        takes back a promotion made by promote_piece()
+        :param piece: promoted Piece object
+        :param state: tuple given by piece.get_state() before the promotion
+        :return: None
+        """
+        if self._attack_map is not None:
+            self.update_attack_map([piece], -1)
+
+        index = self.stoi(piece.get_space())
+        self._key ^= piece_keys[piece.get_player()][kind_of(piece)][index]
+        piece.set_state(state)
+        self._key ^= piece_keys[piece.get_player()][kind_of(piece)][index]
+
+        if self._attack_map is not None:
+            self.update_attack_map([piece], 1)
+
+
+    def promotion_options(self, piece, origin, destination):
+        """
+        finds whether a move can or must promote the moving piece
+        :param piece: Piece object to be moved
+        :param origin: tuple containing piece origin location in format: column, row
+        :param destination: tuple containing piece destination location in format: column, row
+        :return: list of the promote values allowed for the move, [False], [False, True], or [True]
+        """
+        if piece.is_promoted() or origin == (0, 0):
+            return [False]
+        player = piece.get_player()
+        if not (self.in_promotion_zone(destination, player) or self.in_promotion_zone(origin, player)):
+            return [False]
+        if destination[1] in piece.get_forced_rows():
+            return [True]
+        return [False, True]
+
 
     def in_promotion_zone(self, space, player):
         """
@@ -595,19 +1329,18 @@ class Game:
                         pawn_forbidden.append(tuple((col, row + 1)))
 
             enemy_king = self.get_player_king(not player)
-            king_col, king_row = enemy_king.get_space()
-            if player:
-                check_space = king_col, king_row + 1
-            else:
-                check_space = king_col, king_row - 1
-
-            if self.get_piece_on(check_space) is None:
-                tmp = deepcopy(self)
-                if piece.get_player():
-                    tmp.move_piece(tmp._p1_jail[self._p1_jail.index(piece)], check_space)
+            check_space = None
+            if enemy_king is not None:
+                king_col, king_row = enemy_king.get_space()
+                if player:
+                    check_space = king_col, king_row + 1
                 else:
-                    tmp.move_piece(tmp._p2_jail[self._p2_jail.index(piece)], check_space)
-                is_checkmated = tmp.pieces_stuck(not player)
+                    check_space = king_col, king_row - 1
+
+            if check_space is not None and check_space in drop_list:
+                undo_record = self.make_move(piece, piece.get_space(), check_space)
+                is_checkmated = self.pieces_stuck(not player)
+                self.unmake_move(undo_record)
                 if is_checkmated:
                     pawn_forbidden.append(tuple(check_space))
 
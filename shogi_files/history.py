@@ -0,0 +1,136 @@
+class MoveHistory:
+    """
+    moves played in a game, kept as the undo records from Game.make_move() so moves can be taken back and
+    made again without copying the game
+    """
+
+    def __init__(self, limit=None):
+
+        # most moves to remember, the oldest are forgotten once there are more, None for no limit
+        self._limit = limit
+
+        # list of [undo record, piece state before a later promotion or None] for every move
+        self._moves = []
+
+        # number of moves currently made, moves after this can be made again with redo()
+        self._ply = 0
+
+
+    def get_ply(self):
+        return self._ply
+
+    def get_limit(self):
+        return self._limit
+
+    def __len__(self):
+        return len(self._moves)
+
+    def can_undo(self):
+        return self._ply > 0
+
+    def can_redo(self):
+        return self._ply < len(self._moves)
+
+
+    def last_moved(self):
+        """
+        finds the piece that made the last move currently made
+        :return: tuple containing the piece and the space it moved from, or None if no move is made
+        """
+        if not self._ply:
+            return None
+        undo_record = self._moves[self._ply - 1][0]
+        return undo_record[0], undo_record[1]
+
+
+    def push(self, undo_record):
+        """
+        adds a move that was just made, forgetting any moves that could have been made again
+        :param undo_record: tuple returned by Game.make_move()
+        :return: None
+        """
+        del self._moves[self._ply:]
+        self._moves.append([undo_record, None])
+        if self._limit is not None and len(self._moves) > self._limit:
+            del self._moves[0]
+        self._ply = len(self._moves)
+
+
+    def set_promotion(self, state):
+        """
+        notes that the piece of the last move was promoted after moving
+        :param state: tuple given by Piece.get_state() before the promotion
+        :return: None
+        """
+        if self._ply and self._moves[self._ply - 1][1] is None:
+            self._moves[self._ply - 1][1] = state
+
+
+    def undo(self, game):
+        """
+        takes back the last move
+        :param game: Game object the moves were made in
+        :return: True if a move was taken back
+        """
+        if not self._ply:
+            return False
+
+        self._ply -= 1
+        undo_record, promotion_state = self._moves[self._ply]
+        if promotion_state is not None:
+            game.demote_piece(undo_record[0], promotion_state)
+        game.switch_turn()
+        game.unmake_move(undo_record)
+        game.undo_checkmate()
+
+        if game.get_journal() is not None:
+            game.get_journal().record_undo()
+        return True
+
+
+    def redo(self, game):
+        """
+        makes the last move taken back again
+        :param game: Game object the moves were made in
+        :return: True if a move was made
+        """
+        if self._ply >= len(self._moves):
+            return False
+
+        undo_record, promotion_state = self._moves[self._ply]
+        piece, origin, destination = undo_record[:3]
+        promote = promotion_state is not None or undo_record[6] is not None
+
+        # a promotion made with the move is taken back by unmake_move(), so none needs to be noted
+        self._moves[self._ply] = [game.make_move(piece, origin, destination, promote), None]
+        game.switch_turn()
+        self._ply += 1
+
+        if game.get_journal() is not None:
+            game.get_journal().record_redo()
+        return True
+
+
+    def go_to(self, game, ply):
+        """
+        takes back or makes moves until the given number of moves is made
+        :param game: Game object the moves were made in
+        :param ply: int for the number of moves to have made, counted from the oldest move remembered
+        :return: True if the ply could be reached
+        """
+        if ply < 0 or ply > len(self._moves):
+            return False
+        while self._ply > ply:
+            self.undo(game)
+        while self._ply < ply:
+            self.redo(game)
+        return True
+
+
+    def clear(self):
+        """
+        forgets every move
+        :return: None
+        """
+        self._moves = []
+        self._ply = 0
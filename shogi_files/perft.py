@@ -0,0 +1,206 @@
+from shogi_files.game import *
+from shogi_files.bitboard import BitboardGame
+import argparse
+import sys
+import time
+
+
+# published leaf node counts for standard positions, in save file format
+# promotion choices count as separate moves, as they do in other shogi engines
+reference_positions = {
+    'start': (Game._default + '|1',
+              [30, 900, 25470, 719731, 19861490]),
+
+    # 'matsuri' position, a busy middle game often used to test move generators
+    'matsuri': ('l.......n.l.'
+                '.....P+..g.k.'
+                '..n.p..S....'
+                'p..p.....P.p.'
+                '...P...S.p..'
+                '.P.P.b...P..P.'
+                'P......G.S..'
+                'R.........'
+                'L.N.....b.K.L'
+                '|R.G.|g.s.n.p.p.p.p.p.|2',
+                [207, 28684, 4809015]),
+
+    # position with the most legal moves known
+    'max_moves': ('R.........'
+                  '..K..S..S.S.k.'
+                  '....B.....'
+                  '.........'
+                  '.........'
+                  '.........'
+                  '.........'
+                  '.........'
+                  '.L..L..L...'
+                  '|R.B.G.S.N.L.P.|g.g.g.n.n.n.p.p.p.p.p.p.p.p.p.p.p.p.p.p.p.p.p.|1',
+                  [593, 105677]),
+}
+
+
+def move_to_string(move):
+    """
+    writes a move in a short notation, e.g. 77-76, 22-88+ for a promotion, or P*55 for a drop
+    :param move: tuple as given by Game.legal_moves()
+    :return: string for the move
+    """
+    piece, origin, destination, promote = move
+    dest = '%d%d' % destination
+    if origin == (0, 0):
+        return piece.get_sym().upper() + '*' + dest
+    move_str = '%d%d-' % origin + dest
+    if promote:
+        move_str += '+'
+    return move_str
+
+
+def perft(game, depth):
+    """
+    counts the leaf nodes of the move tree to a given depth from the current position
+    :param game: Game object, which is left as it was found
+    :param depth: int for the number of moves to look ahead
+    :return: int for the number of leaf nodes
+    """
+    if depth == 0:
+        return 1
+
+    moves = list(game.legal_moves(game.get_turn()))
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for piece, origin, destination, promote in moves:
+        undo_record = game.make_move(piece, origin, destination, promote)
+        game.switch_turn()
+        nodes += perft(game, depth - 1)
+        game.switch_turn()
+        game.unmake_move(undo_record)
+
+    return nodes
+
+
+def divide(game, depth):
+    """
+    counts the leaf nodes under each move from the current position
+    :param game: Game object, which is left as it was found
+    :param depth: int for the number of moves to look ahead, including the first move
+    :return: list of tuples containing the move string and its number of leaf nodes
+    """
+    results = []
+    for move in list(game.legal_moves(game.get_turn())):
+        piece, origin, destination, promote = move
+        undo_record = game.make_move(piece, origin, destination, promote)
+        game.switch_turn()
+        results.append((move_to_string(move), perft(game, depth - 1)))
+        game.switch_turn()
+        game.unmake_move(undo_record)
+    return results
+
+
+def timed_perft(game, depth):
+    """
+    runs perft() and measures its speed
+    :param game: Game object
+    :param depth: int for the number of moves to look ahead
+    :return: tuple containing the number of leaf nodes, the seconds taken, and the nodes per second
+    """
+    start = time.perf_counter()
+    nodes = perft(game, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed else 0.0
+
+
+def new_game(position, bitboard=False):
+    """
+    creates a game set up in a given position
+    :param position: name from reference_positions or a save file format string
+    :param bitboard: True to use the bitboard backend
+    :return: Game object, or None if the position could not be set up
+    """
+    if position in reference_positions:
+        position = reference_positions[position][0]
+    # the position cache is turned off so the move generator itself is measured
+    if bitboard:
+        game = BitboardGame(cache_size=0)
+    else:
+        game = Game(cache_size=0)
+    if not game.set_up_board(position):
+        return None
+    return game
+
+
+def verify(max_nodes=100000, bitboard=False, out=sys.stdout):
+    """
+    checks the move generator against the published counts of every reference position
+    depths whose expected count is above max_nodes are skipped to keep the run short
+    :param max_nodes: int for the largest count to check
+    :param bitboard: True to use the bitboard backend
+    :param out: file to write the results to
+    :return: True if every count checked matches
+    """
+    passed = True
+    for name, (position, counts) in reference_positions.items():
+        game = new_game(position, bitboard)
+        for depth, expected in enumerate(counts, 1):
+            if expected > max_nodes:
+                break
+            nodes, elapsed, nps = timed_perft(game, depth)
+            result = 'ok' if nodes == expected else 'FAILED'
+            if nodes != expected:
+                passed = False
+            out.write('%-10s depth %d: %d nodes, expected %d, %.2fs, %.0f nodes/s  %s\n'
+                      % (name, depth, nodes, expected, elapsed, nps, result))
+    return passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='count move generator leaf nodes to a given depth')
+    parser.add_argument('-d', '--depth', type=int, default=2, help='number of moves to look ahead')
+    parser.add_argument('-p', '--position', default='start',
+                        help='reference position name (%s) or save file format string'
+                             % ', '.join(reference_positions))
+    parser.add_argument('--divide', action='store_true', help='show the count under each first move')
+    parser.add_argument('--bitboard', action='store_true', help='use the bitboard backend')
+    parser.add_argument('--verify', action='store_true',
+                        help='check every reference position against its published counts')
+    parser.add_argument('--max-nodes', type=int, default=100000,
+                        help='largest published count to check with --verify')
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        return 0 if verify(args.max_nodes, args.bitboard) else 1
+
+    game = new_game(args.position, args.bitboard)
+    if game is None:
+        print('Position could not be set up')
+        return 1
+
+    start = time.perf_counter()
+    if args.divide:
+        results = divide(game, args.depth)
+        for move_str, count in results:
+            print('%s: %d' % (move_str, count))
+        nodes = sum(count for move_str, count in results)
+    else:
+        nodes = perft(game, args.depth)
+    elapsed = time.perf_counter() - start
+
+    print('Nodes: %d' % nodes)
+    print('Time: %.3fs' % elapsed)
+    if elapsed:
+        print('Nodes/second: %.0f' % (nodes / elapsed))
+
+    if args.position in reference_positions:
+        counts = reference_positions[args.position][1]
+        if args.depth <= len(counts):
+            if counts[args.depth - 1] == nodes:
+                print('Matches the published count')
+            else:
+                print('Expected %d' % counts[args.depth - 1])
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,9 +2,18 @@
 
 class Piece:
 
+    # fixed attributes keep pieces small, since every position holds forty of them
+    __slots__ = ('_player', '_space', '_promoted', '_alert_for_promotion', '_forced_promotion')
+
     _diagonals = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
     _cardinals = [(-1, 0), (0, -1), (0, 1), (1, 0)]
 
+    # directions for each player and promotion status, shared by all pieces of a class, see build_dir_tables()
+    _dir_table = {}
+
+    # kind of the piece when unpromoted and promoted, see piece_kinds
+    _kind_pair = (None, None)
+
     def __init__(self, player, space):
 
         # True is player 1, False is player 2
@@ -19,8 +28,8 @@ class Piece:
         # True to alert player whenever piece can promote, False to stop alerts
         self._alert_for_promotion = not self.is_promoted()
 
-        # list of rows in which the piece is forced to promote
-        self._forced_promotion = [None]
+        # tuple of rows in which the piece is forced to promote
+        self._forced_promotion = (None,)
         self.set_forced_rows()
 
 
@@ -113,10 +122,37 @@ class Piece:
                         1 means the piece can move one space, -1 mean the pieces can move infinitely
                  e.g. [([(x, y), (z, a)], 1), ([(b, c)], -1)]
                  the piece can move 1 space in the (x, y) or (z, a) directions and infinitely in the (b, c) direction
+                 the arrays are tuples shared between pieces, so they must not be changed
+        """
+        return self._dir_table.get((self._player, self._promoted))
+
+
+    def make_dirs(self):
+        """
+        builds the directions and distance a piece can legally travel, only called by build_dir_tables()
+        :return: see get_dirs()
         """
         return None
 
 
+    def get_state(self):
+        """
+        gets the parts of the piece that change when it is captured
+        :return: tuple containing player, space, promotion status, and promotion alert status
+        """
+        return self._player, self._space, self._promoted, self._alert_for_promotion
+
+
+    def set_state(self, state):
+        """
+        restores the piece to a state given by get_state()
+        :param state: tuple containing player, space, promotion status, and promotion alert status
+        :return: None
+        """
+        self._player, self._space, self._promoted, self._alert_for_promotion = state
+        self.set_forced_rows()
+
+
     def got_captured(self):
         """
         reset parameters when piece is captured
@@ -153,6 +189,8 @@ class Piece:
 
 class Pawn(Piece):
 
+    __slots__ = ()
+
     def get_name(self):
         return self.get_piece_name('pawn')
 
@@ -161,7 +199,7 @@ class Pawn(Piece):
         return self.get_piece_sym('p')
 
 
-    def get_dirs(self):
+    def make_dirs(self):
         if self._promoted:
             return self.gold_dirs()
         if self._player:
@@ -172,9 +210,9 @@ class Pawn(Piece):
 
     def set_forced_rows(self):
         if self._player:
-            self._forced_promotion = [1]
+            self._forced_promotion = (1,)
         else:
-            self._forced_promotion = [9]
+            self._forced_promotion = (9,)
 
 
     def must_promote(self):
@@ -187,6 +225,8 @@ class Pawn(Piece):
 
 class Lance(Piece):
 
+    __slots__ = ()
+
     def get_name(self):
         return self.get_piece_name('lance')
 
@@ -195,7 +235,7 @@ class Lance(Piece):
         return self.get_piece_sym('l')
 
 
-    def get_dirs(self):
+    def make_dirs(self):
         if self._promoted:
             return self.gold_dirs()
         if self._player:
@@ -206,9 +246,9 @@ class Lance(Piece):
 
     def set_forced_rows(self):
         if self._player:
-            self._forced_promotion = [1]
+            self._forced_promotion = (1,)
         else:
-            self._forced_promotion = [9]
+            self._forced_promotion = (9,)
 
 
     def must_promote(self):
@@ -220,6 +260,8 @@ class Lance(Piece):
 
 class Knight(Piece):
 
+    __slots__ = ()
+
     def get_name(self):
         return self.get_piece_name('knight')
 
@@ -228,7 +270,7 @@ class Knight(Piece):
         return self.get_piece_sym('n')
 
 
-    def get_dirs(self):
+    def make_dirs(self):
         if self._promoted:
             return self.gold_dirs()
         if self._player:
@@ -238,15 +280,13 @@ class Knight(Piece):
 
     def set_forced_rows(self):
         if self._player:
-            self._forced_promotion = [1, 2]
+            self._forced_promotion = (1, 2)
         else:
-            self._forced_promotion = [8, 9]
+            self._forced_promotion = (8, 9)
 
 
     def must_promote(self):
         col, row = self._space
-        print(row)
-        print(self._forced_promotion)
         if row in self._forced_promotion:
             return True
         return False
@@ -254,6 +294,8 @@ class Knight(Piece):
 
 class Silver(Piece):
 
+    __slots__ = ()
+
     def get_name(self):
         return self.get_piece_name('silver_general')
 
@@ -262,7 +304,7 @@ class Silver(Piece):
         return self.get_piece_sym('s')
 
 
-    def get_dirs(self):
+    def make_dirs(self):
         if self._promoted:
             return self.gold_dirs()
         if self._player:
@@ -272,6 +314,8 @@ class Silver(Piece):
 
 class Gold(Piece):
 
+    __slots__ = ()
+
     def is_promoted(self):
         return True
 
@@ -284,12 +328,14 @@ class Gold(Piece):
         return self.get_piece_sym('g')
 
 
-    def get_dirs(self):
+    def make_dirs(self):
         return self.gold_dirs()
 
 
 class Bishop(Piece):
 
+    __slots__ = ()
+
     def get_name(self):
         return self.get_piece_name('bishop')
 
@@ -298,7 +344,7 @@ class Bishop(Piece):
         return self.get_piece_sym('b')
 
 
-    def get_dirs(self):
+    def make_dirs(self):
         if self._promoted:
             return [(self._diagonals, -1), (self._cardinals, 1)]
         return [(self._diagonals, -1)]
@@ -306,6 +352,8 @@ class Bishop(Piece):
 
 class Rook(Piece):
 
+    __slots__ = ()
+
     def get_name(self):
         return self.get_piece_name('rook')
 
@@ -314,7 +362,7 @@ class Rook(Piece):
         return self.get_piece_sym('r')
 
 
-    def get_dirs(self):
+    def make_dirs(self):
         if self._promoted:
             return [(self._cardinals, -1), (self._diagonals, 1)]
         return [(self._cardinals, -1)]
@@ -322,6 +370,8 @@ class Rook(Piece):
 
 class King(Piece):
 
+    __slots__ = ()
+
     def is_promoted(self):
         return True
 
@@ -334,8 +384,51 @@ class King(Piece):
         return self.get_piece_sym('k')
 
 
-    def get_dirs(self):
+    def make_dirs(self):
         return [(self._diagonals + self._cardinals, 1)]
 
 
+# every kind of piece that can be on the board, with promoted pieces as their own kind
+# the first seven kinds are also the kinds of piece that can be held in a jail
+# gold generals and kings cannot promote, so they only appear once
+piece_kinds = [(Pawn, False), (Lance, False), (Knight, False), (Silver, False), (Gold, False),
+               (Bishop, False), (Rook, False), (King, False), (Pawn, True), (Lance, True),
+               (Knight, True), (Silver, True), (Bishop, True), (Rook, True)]
+
+_kind_index = {}
+for _i, (_cls, _promoted) in enumerate(piece_kinds):
+    _kind_index[(_cls, _promoted)] = _i
+_kind_index[(Gold, True)] = _kind_index[(Gold, False)]
+_kind_index[(King, True)] = _kind_index[(King, False)]
+
+king_kind = _kind_index[(King, False)]
+
+for _cls in (Pawn, Lance, Knight, Silver, Gold, Bishop, Rook, King):
+    _cls._kind_pair = (_kind_index[(_cls, False)], _kind_index[(_cls, True)])
+
+
+def kind_of(piece):
+    """
+    finds the kind of a piece
+    :param piece: Piece object
+    :return: int index into piece_kinds
+    """
+    return piece._kind_pair[piece._promoted]
+
+
+def build_dir_tables():
+    """
+    works out the directions of every class of piece for each player and promotion status once,
+    so get_dirs() can hand out shared tuples instead of building new lists on every call
+    :return: None
+    """
+    for cls in (Pawn, Lance, Knight, Silver, Gold, Bishop, Rook, King):
+        cls._dir_table = {}
+        for player in (True, False):
+            for promoted in (False, True):
+                piece = cls(player, (0, 0))
+                piece._promoted = promoted
+                cls._dir_table[(player, promoted)] = tuple((tuple(dirs), limit) for dirs, limit in piece.make_dirs())
+
 
+build_dir_tables()
@@ -161,15 +161,18 @@ def piece_info(piece):
 
     info_frame.pack()
 
-def promotion_alert(piece):
+def promotion_alert(piece, promote=None):
     """
     pops up when a piece becomes eligible for promotion or when attempting to promote a piece eligible for promotion
     :param piece: piece to be promoted
+    :param promote: function taking the piece that promotes it, defaults to the piece promoting itself
     :return: TopLevel object
     """
+    if promote is None:
+        promote = Piece.promote_piece
 
     def accept():
-        piece.promote_piece()
+        promote(piece)
         popup.destroy()
 
     def decline():
@@ -187,7 +190,7 @@ def promotion_alert(piece):
         alert_msg.pack()
         okay_button.pack()
 
-        piece.promote_piece()
+        promote(piece)
     else:
         alert_msg = Label(popup, text='Piece promotion available')
         accept_button = Button(popup, text='Accept', command=accept)
@@ -288,7 +291,7 @@ class SaveLoad:
         files_frame = Frame(popup)
         files_scroll = Scrollbar(files_frame)
         files_scroll.pack(side=RIGHT, fill=Y)
-        list_files = Listbox(files_frame, height=5, selectmode=SINGLE, yscrollcommand=files_scroll.set)
+        list_files = Listbox(files_frame, height=5, width=52, selectmode=SINGLE, yscrollcommand=files_scroll.set)
         list_files.pack(expand=True, side=RIGHT, fill=Y)
         for f in save_files:
             list_files.insert(END, f)
@@ -0,0 +1,355 @@
+from shogi_files.game import *
+from shogi_files.record import GameRecord, read_errors
+from shogi_files.replay import replay_record
+import argparse
+import heapq
+import mmap
+import struct
+import sys
+import tempfile
+import time
+
+
+# file layout: 16 byte header, then records sorted by key
+#   header: magic, version, number of records
+#   record: 8 byte big-endian zobrist key, then the packed position
+_magic = b'SHOGIPDB'
+_version = 1
+_header = struct.Struct('>8sII')
+
+_squares = 81
+
+# bits for each square: 0 is empty, 1 to 14 are player 1 kinds, 15 to 28 are player 2 kinds
+_square_bits = 5
+
+# bits for the count of each kind a player can hold, indexed like piece_kinds
+_hand_bits = [5, 3, 3, 3, 3, 2, 2]
+
+# 405 square bits + 42 hand bits + 1 turn bit = 448 bits
+packed_size = (_squares * _square_bits + 2 * sum(_hand_bits) + 1) // 8
+_key_size = 8
+record_size = _key_size + packed_size
+
+# most records sorted in memory at once while building a database
+_run_records = 1 << 20
+
+
+def build_symbols():
+    """
+    finds the save file symbol of every kind of piece
+    :return: list of player 1 symbols indexed like piece_kinds, e.g. 'P' or 'P+'
+    """
+    symbols = []
+    for cls, promoted in piece_kinds:
+        piece = cls(True, (0, 0))
+        if promoted:
+            piece.promote_piece()
+        symbols.append(piece.get_sym())
+    return symbols
+
+
+_symbols = build_symbols()
+
+
+def pack_position(game):
+    """
+    encodes a position in a fixed number of bytes
+    :param game: Game object
+    :return: bytes of length packed_size
+    """
+    bits = 0
+    board = game.get_board()
+    for index in range(_squares):
+        bits <<= _square_bits
+        piece = board[index]
+        if piece is not None:
+            code = kind_of(piece) + 1
+            if not piece.get_player():
+                code += len(piece_kinds)
+            bits |= code
+
+    for player in (True, False):
+        counts = game.get_jail_counts(player)
+        for kind, width in enumerate(_hand_bits):
+            bits = (bits << width) | counts[kind]
+
+    bits = (bits << 1) | (not game.get_turn())
+    return bits.to_bytes(packed_size, 'big')
+
+
+def unpack_position(packed):
+    """
+    decodes a packed position
+    :param packed: bytes or memoryview as given by pack_position()
+    :return: save file format string, including whose turn it is
+    """
+    bits = int.from_bytes(packed, 'big')
+
+    turn = '2' if bits & 1 else '1'
+    bits >>= 1
+
+    jails = []
+    for player in (False, True):
+        jail = ''
+        for kind in reversed(range(len(_hand_bits))):
+            width = _hand_bits[kind]
+            count = bits & ((1 << width) - 1)
+            bits >>= width
+            sym = _symbols[kind] if player else _symbols[kind].lower()
+            jail = (sym + '.') * count + jail
+        jails.append(jail)
+
+    cells = []
+    mask = (1 << _square_bits) - 1
+    for index in range(_squares):
+        code = bits & mask
+        bits >>= _square_bits
+        if code == 0:
+            cells.append('')
+        elif code <= len(piece_kinds):
+            cells.append(_symbols[code - 1])
+        else:
+            cells.append(_symbols[code - 1 - len(piece_kinds)].lower())
+    cells.reverse()
+
+    return '.'.join(cells) + '|' + jails[1] + '|' + jails[0] + '|' + turn
+
+
+def make_record(game):
+    """
+    creates the database record of a position
+    :param game: Game object
+    :return: bytes of length record_size
+    """
+    return game.get_key().to_bytes(_key_size, 'big') + pack_position(game)
+
+
+class PositionDB:
+    """
+    read-only database of packed positions, memory-mapped and sorted by zobrist key
+    records are read straight from the mapped file without being copied or parsed
+    """
+
+    def __init__(self, path):
+
+        self._path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, version, count = _header.unpack_from(self._map, 0)
+        if magic != _magic or version != _version:
+            self.close()
+            raise ValueError('%s is not a position database' % path)
+        self._count = count
+
+
+    def get_path(self):
+        return self._path
+
+    def __len__(self):
+        return self._count
+
+
+    def key_at(self, i):
+        """
+        reads the key of a record
+        :param i: int for the record number
+        :return: int zobrist key
+        """
+        offset = _header.size + i * record_size
+        return int.from_bytes(self._view[offset:offset + _key_size], 'big')
+
+
+    def find(self, key):
+        """
+        binary searches for a position
+        :param key: int zobrist key, e.g. from Game.get_key()
+        :return: int for the record number, or None if the position is not in the database
+        """
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self.key_at(low) == key:
+            return low
+        return None
+
+
+    def get(self, key):
+        """
+        finds the packed position for a key
+        :param key: int zobrist key, e.g. from Game.get_key()
+        :return: memoryview of the packed position, or None if it is not in the database
+        """
+        i = self.find(key)
+        if i is None:
+            return None
+        offset = _header.size + i * record_size + _key_size
+        return self._view[offset:offset + packed_size]
+
+
+    def __contains__(self, game):
+        return self.find(game.get_key()) is not None
+
+
+    def scan(self):
+        """
+        goes through every record in key order
+        :return: generator of tuples containing the key and a memoryview of the packed position
+        """
+        for i in range(self._count):
+            offset = _header.size + i * record_size
+            yield self.key_at(i), self._view[offset + _key_size:offset + record_size]
+
+
+    def close(self):
+        """
+        unmaps and closes the database file, any memoryviews given out must be released first
+        :return: None
+        """
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        self._map.close()
+        self._file.close()
+
+
+def write_run(records):
+    """
+    sorts a batch of records and writes it to a temporary file
+    :param records: list of record bytes
+    :return: temporary file positioned at its start
+    """
+    records.sort()
+    run = tempfile.TemporaryFile()
+    run.write(b''.join(records))
+    run.seek(0)
+    return run
+
+
+def read_run(run):
+    """
+    reads the records of a temporary file written by write_run()
+    :param run: file object
+    :return: generator of record bytes
+    """
+    while True:
+        record = run.read(record_size)
+        if len(record) < record_size:
+            return
+        yield record
+
+
+def build(path, records, run_records=_run_records):
+    """
+    writes a database from records in any order, sorting them in batches so memory use stays bounded
+    positions with the same key are stored once
+    :param path: path of the database file to create
+    :param records: iterable of record bytes, e.g. from make_record()
+    :param run_records: int for the most records sorted in memory at once
+    :return: int for the number of records written
+    """
+    runs = []
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= run_records:
+            runs.append(write_run(batch))
+            batch = []
+    if batch:
+        runs.append(write_run(batch))
+
+    count = 0
+    f = open(path, 'wb')
+    f.write(_header.pack(_magic, _version, 0))
+    last_key = None
+    for record in heapq.merge(*[read_run(run) for run in runs]):
+        key = record[:_key_size]
+        if key != last_key:
+            f.write(record)
+            count += 1
+            last_key = key
+    f.seek(0)
+    f.write(_header.pack(_magic, _version, count))
+    f.close()
+
+    for run in runs:
+        run.close()
+    return count
+
+
+def records_from_files(paths):
+    """
+    reads the positions in journal files, or text files of save strings with one per line
+    journals that cannot be read are skipped, and only the moves before the first illegal one are used
+    :param paths: iterable of file paths
+    :return: generator of record bytes
+    """
+    game = Game(cache_size=0)
+    for path in paths:
+        if path.endswith('.jnl'):
+            # a journal that cannot be read is skipped, and one with an illegal move is kept up to that move
+            try:
+                record = GameRecord(path)
+            except read_errors:
+                continue
+            snapshots = record.get_snapshots()
+            if 0 not in snapshots or not game.set_up_board(snapshots[0]):
+                continue
+            yield make_record(game)
+            for player, key, move in replay_record(record, game):
+                yield make_record(game)
+        else:
+            f = open(path, 'r')
+            for line in f:
+                line = line.strip()
+                if line and game.set_up_board(line):
+                    yield make_record(game)
+            f.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build or search a memory-mapped position database')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='build a database from game journals or save strings')
+    build_parser.add_argument('database', help='database file to create')
+    build_parser.add_argument('inputs', nargs='+', help='.jnl journals, or text files with one save string per line')
+
+    lookup_parser = commands.add_parser('lookup', help='look up a position')
+    lookup_parser.add_argument('database', help='database file to search')
+    lookup_parser.add_argument('position', help='save file format string or SFEN')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        count = build(args.database, records_from_files(args.inputs))
+        print('Positions: %d' % count)
+        print('Size: %d bytes' % (_header.size + count * record_size))
+        print('Time: %.3fs' % (time.perf_counter() - start))
+        return 0
+
+    game = Game(cache_size=0)
+    if not (game.from_sfen(args.position) or game.set_up_board(args.position)):
+        print('Position could not be set up')
+        return 1
+    db = PositionDB(args.database)
+    packed = db.get(game.get_key())
+    elapsed = time.perf_counter() - start
+    if packed is None:
+        print('Not found')
+    else:
+        print('Found: %s' % unpack_position(packed))
+        packed.release()
+    print('Searched %d positions in %.6fs' % (len(db), elapsed))
+    db.close()
+    return 0 if packed is not None else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
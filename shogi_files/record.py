@@ -0,0 +1,308 @@
+from shogi_files.game import *
+from shogi_files.perft import move_to_string
+import argparse
+import sys
+import time
+
+
+# journal lines, one entry per line:
+#   S <ply> <save string>   snapshot of the position after <ply> moves
+#   M <move>                move in perft notation without promotion, e.g. 77-76 or P*55
+#   P <space>               the piece on the space was promoted, e.g. P 22
+#   U                       the last move and its promotion were taken back
+#   D                       the last move taken back was made again
+#   E <player>              the game ended with a win for player 1 or 2, or 0 for a draw
+_snapshot = 'S'
+_move = 'M'
+_promotion = 'P'
+_undo = 'U'
+_redo = 'D'
+_end = 'E'
+
+# errors GameRecord raises for a journal that cannot be read, e.g. a missing file or a malformed line
+read_errors = (OSError, ValueError, IndexError, KeyError)
+
+
+def position_string(game):
+    """
+    writes a position in the save file format, including whose turn it is
+    :param game: Game object
+    :return: string that Game.set_up_board() accepts
+    """
+    return game.game_to_strings() + '|' + ('1' if game.get_turn() else '2')
+
+
+class GameJournal:
+    """
+    append-only record of a game, written one line per move as the game is played
+    a snapshot of the position is added every few moves so any ply can be rebuilt without replaying from the start
+    """
+
+    _snapshot_interval = 16
+
+    def __init__(self, path, game, snapshot_interval=None):
+
+        self._path = path
+        if snapshot_interval is None:
+            snapshot_interval = self._snapshot_interval
+        self._snapshot_interval = snapshot_interval
+
+        # number of moves in the game so far, not counting moves that were taken back
+        self._ply = 0
+
+        # number of moves taken back that can still be made again
+        self._undone = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', buffering=1)
+        self.write(_snapshot, '0', position_string(game))
+
+
+    def get_path(self):
+        return self._path
+
+    def get_ply(self):
+        return self._ply
+
+    def __deepcopy__(self, memo):
+        # copies of a game, e.g. undo backups, keep writing to the same journal
+        return self
+
+
+    def write(self, *fields):
+        """
+        appends one line to the journal
+        :param fields: strings making up the line
+        :return: None
+        """
+        self._file.write(' '.join(fields) + '\n')
+
+
+    def record_move(self, game, piece, origin, destination):
+        """
+        records a move before it is made, adding a snapshot first if one is due
+        :param game: Game object the move is made in
+        :param piece: Piece object to be moved
+        :param origin: tuple containing piece origin location in format: column, row
+        :param destination: tuple containing piece destination location in format: column, row
+        :return: None
+        """
+        if self._ply and self._ply % self._snapshot_interval == 0:
+            self.write(_snapshot, str(self._ply), position_string(game))
+        self.write(_move, move_to_string((piece, origin, destination, False)))
+        self._ply += 1
+        self._undone = 0
+
+
+    def record_promotion(self, space):
+        """
+        records the promotion of a piece
+        :param space: tuple containing the location of the promoted piece in format: column, row
+        :return: None
+        """
+        self.write(_promotion, '%d%d' % space)
+
+
+    def record_undo(self):
+        """
+        records that the last move was taken back
+        :return: None
+        """
+        if self._ply:
+            self.write(_undo)
+            self._ply -= 1
+            self._undone += 1
+
+
+    def record_redo(self):
+        """
+        records that the last move taken back was made again
+        :return: None
+        """
+        if self._undone:
+            self.write(_redo)
+            self._ply += 1
+            self._undone -= 1
+
+
+    def record_result(self, winner):
+        """
+        records the end of the game
+        :param winner: True if player 1 won, False if player 2 won, None for a draw
+        :return: None
+        """
+        if winner is None:
+            self.write(_end, '0')
+        else:
+            self.write(_end, '1' if winner else '2')
+
+
+    def close(self):
+        """
+        closes the journal file
+        :return: None
+        """
+        self._file.close()
+
+
+class GameRecord:
+    """
+    game read back from a journal, able to rebuild the position at any ply
+    """
+
+    def __init__(self, path):
+
+        # move strings of the game, each followed by the spaces of any promotions that came after it
+        self._moves = []
+
+        # ply to save string for every snapshot still valid after moves were taken back
+        self._snapshots = {}
+
+        # winner, or None if the game did not finish or was drawn
+        self._winner = None
+        self._finished = False
+
+        self.read(path)
+
+
+    def get_moves(self):
+        return [move for move, promotions in self._moves]
+
+    def get_entries(self):
+        return self._moves
+
+    def get_snapshots(self):
+        return self._snapshots
+
+    def get_winner(self):
+        return self._winner
+
+    def is_finished(self):
+        return self._finished
+
+    def is_draw(self):
+        return self._finished and self._winner is None
+
+    def __len__(self):
+        return len(self._moves)
+
+
+    def read(self, path):
+        """
+        reads a journal, applying any moves that were taken back or made again
+        :param path: path of the journal file
+        :return: None
+        """
+        undone = []
+        f = open(path, 'r')
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            entry = fields[0]
+            if entry == _snapshot:
+                self._snapshots[int(fields[1])] = fields[2]
+            elif entry == _move:
+                self._moves.append((fields[1], []))
+                undone = []
+            elif entry == _promotion:
+                self._moves[-1][1].append(fields[1])
+            elif entry == _undo:
+                undone.append(self._moves.pop())
+                self._winner = None
+                self._finished = False
+                for ply in [ply for ply in self._snapshots if ply > len(self._moves)]:
+                    del self._snapshots[ply]
+            elif entry == _redo:
+                self._moves.append(undone.pop())
+            elif entry == _end:
+                self._finished = True
+                self._winner = None if fields[1] == '0' else fields[1] == '1'
+        f.close()
+
+
+    def position_at(self, ply=None, game=None):
+        """
+        rebuilds the position after a number of moves, starting from the nearest snapshot before it
+        :param ply: int for the number of moves to apply, default is the whole game
+        :param game: Game object to set up, a new one is made if not given
+        :return: Game object in the position, or None if the ply is not in the game
+        """
+        if ply is None:
+            ply = len(self._moves)
+        if ply < 0 or ply > len(self._moves):
+            return None
+
+        start = max(snapshot for snapshot in self._snapshots if snapshot <= ply)
+        if game is None:
+            game = Game()
+        game.set_up_board(self._snapshots[start])
+        game.set_move_number(start + 1)
+
+        for move_str, promotions in self._moves[start:ply]:
+            apply_move(game, move_str)
+            game.switch_turn()
+            for space in promotions:
+                game.promote_piece(game.get_piece_on((int(space[0]), int(space[1]))))
+        return game
+
+
+def parse_move(game, move_str):
+    """
+    reads a move written in perft notation without promotion, e.g. 77-76 or P*55
+    :param game: Game object whose turn it is to make the move
+    :param move_str: string for the move
+    :return: tuple containing the Piece object, or None if there is no such piece on the origin or in the jail of
+             the player to move, the origin, (0, 0) for a drop, and the destination
+    """
+    destination = (int(move_str[-2]), int(move_str[-1]))
+    if move_str[1] == '*':
+        if game.get_turn():
+            jail = game.get_p1_jail()
+        else:
+            jail = game.get_p2_jail()
+        pieces = [piece for piece in jail if piece.get_sym().upper() == move_str[0]]
+        return pieces[0] if pieces else None, (0, 0), destination
+
+    origin = (int(move_str[0]), int(move_str[1]))
+    return game.get_piece_on(origin), origin, destination
+
+
+def apply_move(game, move_str):
+    """
+    makes a move written in perft notation without promotion, e.g. 77-76 or P*55
+    :param game: Game object
+    :param move_str: string for the move
+    :return: undo record, see Game.make_move()
+    """
+    return game.make_move(*parse_move(game, move_str))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='show the position at any point of a recorded game')
+    parser.add_argument('journal', help='journal file of the game')
+    parser.add_argument('-p', '--ply', type=int, default=None, help='number of moves to replay, default is all')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    record = GameRecord(args.journal)
+    game = record.position_at(args.ply)
+    elapsed = time.perf_counter() - start
+    if game is None:
+        print('The game has %d moves' % len(record))
+        return 1
+
+    print(game)
+    print('Moves: %s' % ' '.join(record.get_moves()[:args.ply]))
+    if record.get_winner() is not None:
+        print('Player %d won' % (1 if record.get_winner() else 2))
+    elif record.is_draw():
+        print('Draw')
+    print('Replayed in %.3fs' % elapsed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+from shogi_files.game import *
+from shogi_files.bitboard import BitboardGame
+from shogi_files.record import GameRecord, parse_move
+from multiprocessing import Pool
+import argparse
+import threading
+import sys
+import time
+
+
+# extension of the journal files written by record.GameJournal
+_journal_ext = '.jnl'
+
+
+def find_games(paths):
+    """
+    lists game files one at a time, so huge archives are never held in memory
+    :param paths: iterable of journal files and directories to search, '-' reads the paths from standard input
+    :return: generator of journal file paths
+    """
+    for path in paths:
+        if path == '-':
+            for line in sys.stdin:
+                line = line.strip()
+                if line:
+                    yield from find_games([line])
+        elif os.path.isdir(path):
+            for entry in os.scandir(path):
+                if entry.is_dir():
+                    yield from find_games([entry.path])
+                elif entry.name.endswith(_journal_ext):
+                    yield entry.path
+        else:
+            yield path
+
+
+def check_move(game, move_str, promotions):
+    """
+    makes a recorded move if it is legal
+    :param game: Game object whose turn it is to make the move
+    :param move_str: string for the move in perft notation without promotion, e.g. 77-76 or P*55
+    :param promotions: list of spaces promoted after the move, as written in the journal
+    :return: string describing why the move is illegal, or None if it was made
+    """
+    piece, origin, destination = parse_move(game, move_str)
+    if piece is None:
+        if origin == (0, 0):
+            return 'no %s in the jail to drop' % move_str[0]
+        return 'no piece on %d%d' % origin
+    if piece.get_player() != game.get_turn():
+        return 'piece on %d%d belongs to the other player' % origin
+
+    if destination not in game.possible_moves(piece):
+        return 'piece cannot move to %d%d' % destination
+
+    if [space for space in promotions if space != '%d%d' % destination]:
+        return 'promoted a piece that did not just move'
+    if len(promotions) not in [int(option) for option in game.promotion_options(piece, origin, destination)]:
+        if promotions:
+            return 'piece cannot promote'
+        return 'piece must promote'
+
+    game.make_move(piece, origin, destination, bool(promotions))
+    game.switch_turn()
+    return None
+
+
+def replay_record(record, game, max_ply=None):
+    """
+    replays the legal moves of a recorded game from its start, stopping at the first illegal move
+    :param record: GameRecord object
+    :param game: Game object to replay the moves in, it is set up with the starting position of the record
+    :param max_ply: int for the most moves to replay, None for every move
+    :return: generator of tuples containing the player making each move, the key of the position it was made from,
+             and the move as given by Game.legal_moves(), each given once the move has been made
+    """
+    snapshots = record.get_snapshots()
+    if 0 not in snapshots or not game.set_up_board(snapshots[0]):
+        return
+    for move_str, promotions in record.get_entries()[:max_ply]:
+        player = game.get_turn()
+        key = game.get_key()
+        piece, origin, destination = parse_move(game, move_str)
+        if check_move(game, move_str, promotions) is not None:
+            return
+        yield player, key, (piece, origin, destination, bool(promotions))
+
+
+def replay_game(path):
+    """
+    replays a recorded game through the game rules, checking every move, snapshot, and the result
+    :param path: path of the journal file
+    :return: tuple containing the path, the number of moves replayed, the list of illegal moves found
+             as (ply, move, reason), and an error message if the file could not be replayed or None
+    """
+    findings = []
+    moves = 0
+    try:
+        record = GameRecord(path)
+        snapshots = record.get_snapshots()
+        if 0 not in snapshots:
+            return path, 0, findings, 'no starting position'
+
+        game = BitboardGame()
+        if not game.set_up_board(snapshots[0]):
+            return path, 0, findings, 'starting position is not legal'
+        check_game = Game()
+
+        for ply, (move_str, promotions) in enumerate(record.get_entries()):
+            if ply in snapshots and ply:
+                check_game.set_up_board(snapshots[ply])
+                if check_game.get_key() != game.get_key():
+                    findings.append((ply, '', 'snapshot does not match the moves before it'))
+                    return path, moves, findings, None
+
+            reason = check_move(game, move_str, promotions)
+            if reason is not None:
+                findings.append((ply + 1, move_str, reason))
+                return path, moves, findings, None
+            moves += 1
+
+        winner = record.get_winner()
+        if winner is not None:
+            if not game.is_in_checkmate(game.get_turn()):
+                findings.append((moves, '', 'game ended without checkmate'))
+            elif winner == game.get_turn():
+                findings.append((moves, '', 'recorded winner is the player in checkmate'))
+
+    except (OSError, ValueError, IndexError, KeyError) as e:
+        return path, moves, findings, '%s: %s' % (type(e).__name__, e)
+
+    return path, moves, findings, None
+
+
+def bounded(items, slots, stop):
+    """
+    passes items through only as fast as results are taken, so the pool never queues more than a few games
+    :param items: iterable of tasks
+    :param slots: threading.Semaphore released once for every result taken
+    :param stop: threading.Event set when results are no longer taken, so the pool is not left waiting on a slot
+    :return: generator of the tasks
+    """
+    for item in items:
+        while not slots.acquire(timeout=0.1):
+            if stop.is_set():
+                return
+        if stop.is_set():
+            return
+        yield item
+
+
+def replay_games(paths, workers=None, max_pending=None):
+    """
+    replays many recorded games in a process pool
+    :param paths: iterable of journal file paths, read lazily
+    :param workers: int for the number of worker processes, default is one per core, 1 replays in this process
+    :param max_pending: int for the most games sent to workers but not yet reported, default is 4 per worker
+    :return: generator of tuples as given by replay_game(), in the order the games finish
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for path in paths:
+            yield replay_game(path)
+        return
+
+    if max_pending is None:
+        max_pending = 4 * workers
+    slots = threading.Semaphore(max_pending)
+    stop = threading.Event()
+    with Pool(workers) as pool:
+        try:
+            for result in pool.imap_unordered(replay_game, bounded(paths, slots, stop)):
+                slots.release()
+                yield result
+        finally:
+            # the caller may stop early, and the pool cannot shut down while its feeder waits for a slot
+            stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='replay recorded games and check every move against the rules')
+    parser.add_argument('paths', nargs='+',
+                        help='journal files or directories of them, - reads paths from standard input')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes, default is one per core')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='most games waiting for a worker at once, default is 4 per worker')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only show the summary')
+    args = parser.parse_args(argv)
+
+    games = 0
+    moves = 0
+    illegal = 0
+    errors = 0
+    start = time.perf_counter()
+    for path, game_moves, findings, error in replay_games(find_games(args.paths), args.workers, args.max_pending):
+        games += 1
+        moves += game_moves
+        if findings:
+            illegal += 1
+        if error is not None:
+            errors += 1
+        if not args.quiet:
+            for ply, move_str, reason in findings:
+                print('%s: move %d %s: %s' % (path, ply, move_str, reason))
+            if error is not None:
+                print('%s: error: %s' % (path, error))
+    elapsed = time.perf_counter() - start
+
+    print('Games: %d' % games)
+    print('Moves: %d' % moves)
+    print('Games with illegal moves: %d' % illegal)
+    print('Games with errors: %d' % errors)
+    print('Time: %.3fs' % elapsed)
+    if elapsed:
+        print('Games/second: %.1f' % (games / elapsed))
+        print('Moves/second: %.0f' % (moves / elapsed))
+    return 1 if illegal or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
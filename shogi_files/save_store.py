@@ -0,0 +1,200 @@
+import os
+import re
+import sqlite3
+import time
+
+
+class SaveStore:
+    """
+    index of saved games kept in a SQLite database in the save directory
+    each save is also written out as shogi_save<number>.txt so older versions can still load it
+    several processes can save at the same time, SQLite hands each one its own save number
+    """
+
+    _db_name = 'saves.db'
+    _file_pattern = re.compile(r'^shogi_save(\d+)\.txt$')
+
+    # seconds to wait for another process to finish writing before giving up
+    _timeout = 30.0
+
+    def __init__(self, location):
+
+        # directory holding the database and the save files
+        self._location = location
+        self._db_path = os.path.join(location, self._db_name)
+
+        self.create()
+
+
+    def get_location(self):
+        return self._location
+
+
+    def file_name(self, save_num):
+        """
+        gives the name of the file a save is written to
+        :param save_num: int for the save number
+        :return: string file name, e.g. shogi_save3.txt
+        """
+        return 'shogi_save' + str(save_num) + '.txt'
+
+
+    def create(self):
+        """
+        creates the database if needed and indexes any save files already in the directory, once for the store
+        :return: None
+        """
+        if not os.path.isdir(self._location):
+            os.makedirs(self._location, exist_ok=True)
+
+        conn = self.connect()
+        try:
+            # WAL mode is kept in the database file, so readers never wait for a save being written
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('CREATE TABLE IF NOT EXISTS saves ('
+                             'save_num INTEGER PRIMARY KEY AUTOINCREMENT, '
+                             'position TEXT NOT NULL, '
+                             'created REAL NOT NULL, '
+                             'move_number INTEGER NOT NULL, '
+                             'turn INTEGER NOT NULL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS saves_created ON saves (created)')
+                conn.execute('CREATE INDEX IF NOT EXISTS saves_turn ON saves (turn, move_number)')
+                conn.execute('CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT)')
+                if conn.execute("SELECT 1 FROM info WHERE name = 'imported'").fetchone() is None:
+                    self.import_files(conn)
+                    conn.execute("INSERT INTO info VALUES ('imported', '1')")
+        finally:
+            conn.close()
+
+
+    def connect(self):
+        """
+        opens the database created by create()
+        reads run as single statements, each in its own deferred transaction, so they never take the write lock
+        :return: sqlite3 connection in autocommit mode
+        """
+        return sqlite3.connect(self._db_path, timeout=self._timeout, isolation_level=None)
+
+
+    def import_files(self, conn):
+        """
+        adds the save files made before the database existed, keeping their save numbers
+        :param conn: sqlite3 connection inside a transaction
+        :return: int for the number of saves added
+        """
+        added = 0
+        for name in os.listdir(self._location):
+            match = self._file_pattern.match(name)
+            if match is None:
+                continue
+            path = os.path.join(self._location, name)
+            f = open(path, 'r')
+            position = f.read()
+            f.close()
+            if len(position) < 2 or position[-2] != '|' or position[-1] not in '12':
+                continue
+            conn.execute('INSERT OR IGNORE INTO saves VALUES (?, ?, ?, ?, ?)',
+                         (int(match.group(1)), position, os.path.getmtime(path), 1, position[-1] == '1'))
+            added += 1
+        return added
+
+
+    def add(self, position, turn, move_number=1):
+        """
+        stores a position as a new save
+        :param position: save file format string, including whose turn it is
+        :param turn: True if it is player 1's turn
+        :param move_number: int for the move number of the position
+        :return: int for the save number
+        """
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                cursor = conn.execute('INSERT INTO saves (position, created, move_number, turn) '
+                                      'VALUES (?, ?, ?, ?)', (position, time.time(), move_number, turn))
+                save_num = cursor.lastrowid
+        finally:
+            conn.close()
+
+        # the save number is unique, so no other process writes this file
+        f = open(os.path.join(self._location, self.file_name(save_num)), 'w')
+        f.write(position)
+        f.close()
+        return save_num
+
+
+    def get(self, save_num):
+        """
+        finds a saved position
+        :param save_num: int for the save number
+        :return: tuple containing the save file format string and the move number, or None if there is no such save
+        """
+        conn = self.connect()
+        try:
+            return conn.execute('SELECT position, move_number FROM saves WHERE save_num = ?',
+                                (save_num,)).fetchone()
+        finally:
+            conn.close()
+
+
+    def find(self, turn=None, min_move=None, max_move=None, since=None, limit=None):
+        """
+        lists saves matching the given details, newest first
+        :param turn: True or False to only list saves where it is that player's turn
+        :param min_move: int for the lowest move number to list
+        :param max_move: int for the highest move number to list
+        :param since: float timestamp of the oldest save to list
+        :param limit: int for the most saves to list
+        :return: list of tuples containing the save number, the timestamp, the move number, and whose turn it is
+        """
+        conditions = []
+        values = []
+        if turn is not None:
+            conditions.append('turn = ?')
+            values.append(turn)
+        if min_move is not None:
+            conditions.append('move_number >= ?')
+            values.append(min_move)
+        if max_move is not None:
+            conditions.append('move_number <= ?')
+            values.append(max_move)
+        if since is not None:
+            conditions.append('created >= ?')
+            values.append(since)
+
+        query = 'SELECT save_num, created, move_number, turn FROM saves'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY save_num DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            values.append(limit)
+
+        conn = self.connect()
+        try:
+            return [(save_num, created, move_number, bool(turn))
+                    for save_num, created, move_number, turn in conn.execute(query, values)]
+        finally:
+            conn.close()
+
+
+    def __len__(self):
+        conn = self.connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM saves').fetchone()[0]
+        finally:
+            conn.close()
+
+
+def describe_save(save):
+    """
+    writes a short description of a save for lists
+    :param save: tuple as given by SaveStore.find()
+    :return: string, e.g. shogi_save3  move 12  player 2 to move  2022-03-01 14:05
+    """
+    save_num, created, move_number, turn = save
+    return 'shogi_save%d  move %d  player %d to move  %s' \
+           % (save_num, move_number, 1 if turn else 2, time.strftime('%Y-%m-%d %H:%M', time.localtime(created)))
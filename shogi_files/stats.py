@@ -0,0 +1,364 @@
+from shogi_files.game import *
+from shogi_files.bitboard import BitboardGame
+from shogi_files.record import GameRecord, read_errors
+from shogi_files.replay import find_games, replay_record, bounded
+from shogi_files.book import encode_move, decode_move
+from shogi_files.perft import move_to_string
+from multiprocessing import Pool
+import argparse
+import heapq
+import mmap
+import struct
+import tempfile
+import threading
+import sys
+import time
+
+
+# file layout: header, then one record for every move played from every position, sorted by key and move code
+#   header: magic, version, number of records
+#   record: zobrist key of the position, move code from book.encode_move(), times played, and how many of those
+#           games the player making the move won, drew, and lost, the rest did not finish
+_magic = b'SHOGIST1'
+_version = 2
+_header = struct.Struct('>8sII')
+_record = struct.Struct('>QHIIII')
+
+# most different position and move pairs counted in memory before they are written out as a sorted run
+_max_entries = 1 << 20
+
+# games sent to a worker at a time, and how many of those batches each worker may have waiting
+_chunk_size = 8
+_chunks_per_worker = 2
+
+# results of a game for the player making a move, indexing the counts after times played
+_win = 0
+_draw = 1
+_loss = 2
+_unfinished = None
+
+
+def game_entries(task):
+    """
+    replays a recorded game and lists the moves played from each position, run in a worker process
+    the zobrist key of a position is the same however it was reached and in whatever order the pieces were captured,
+    so transpositions are counted together
+    :param task: tuple containing the path of the journal file and the number of moves from the start to use,
+                 None for every move
+    :return: list of tuples containing the position key, move code, and the result for the player making the move,
+             _unfinished if the game has no recorded result; the moves before the first illegal one are kept,
+             a game that cannot be read gives an empty list
+    """
+    path, max_ply = task
+    try:
+        record = GameRecord(path)
+    except read_errors:
+        return []
+    game = BitboardGame(cache_size=0)
+
+    entries = []
+    for player, key, move in replay_record(record, game, max_ply):
+        if not record.is_finished():
+            result = _unfinished
+        elif record.is_draw():
+            result = _draw
+        elif record.get_winner() == player:
+            result = _win
+        else:
+            result = _loss
+        entries.append((key, encode_move(game, move), result))
+    return entries
+
+
+def write_run(counts):
+    """
+    sorts counted moves and writes them to a temporary file
+    :param counts: dictionary of (position key, move code) to list of times played, wins, draws, and losses
+    :return: temporary file positioned at its start
+    """
+    run = tempfile.TemporaryFile()
+    run.write(b''.join(_record.pack(key, code, *counts[key, code]) for key, code in sorted(counts)))
+    run.seek(0)
+    return run
+
+
+def read_run(run):
+    """
+    reads the records of a file written by write_run()
+    :param run: file object
+    :return: generator of tuples containing the position key, move code, times played, wins, draws, and losses
+    """
+    while True:
+        data = run.read(_record.size * 4096)
+        if not data:
+            return
+        yield from _record.iter_unpack(data)
+
+
+def merge_runs(runs):
+    """
+    merges sorted runs, adding up the counts of the same move from the same position
+    :param runs: list of file objects written by write_run()
+    :return: generator of tuples as given by read_run(), each position and move once, in key order
+    """
+    last = None
+    for record in heapq.merge(*[read_run(run) for run in runs]):
+        if last is not None and last[0] == record[0] and last[1] == record[1]:
+            for i in range(2, len(record)):
+                last[i] += record[i]
+            continue
+        if last is not None:
+            yield tuple(last)
+        last = list(record)
+    if last is not None:
+        yield tuple(last)
+
+
+def collect(paths, workers=None, max_ply=None, max_entries=_max_entries):
+    """
+    counts the moves played from each position of many recorded games, in a process pool
+    counts are kept in memory only up to a limit and then written out as sorted runs, so archives of any size can
+    be counted
+    :param paths: iterable of journal file paths, read lazily
+    :param workers: int for the number of worker processes, default is one per core, 1 counts in this process
+    :param max_ply: int for the number of moves from the start of each game to count, None for every move
+    :param max_entries: int for the most position and move pairs counted in memory at once
+    :return: tuple containing the list of runs for merge_runs(), the number of games, and the number of moves
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tasks = ((path, max_ply) for path in paths)
+
+    runs = []
+    counts = {}
+    games = 0
+    moves = 0
+
+    def count(entries):
+        nonlocal counts, games, moves
+        games += 1
+        moves += len(entries)
+        for key, code, result in entries:
+            totals = counts.get((key, code))
+            if totals is None:
+                totals = counts[key, code] = [0, 0, 0, 0]
+            totals[0] += 1
+            if result is not _unfinished:
+                totals[1 + result] += 1
+        if len(counts) >= max_entries:
+            runs.append(write_run(counts))
+            counts = {}
+
+    if workers <= 1:
+        for task in tasks:
+            count(game_entries(task))
+    else:
+        # enough slots for every worker to have a full batch running and another waiting
+        slots = threading.Semaphore(_chunks_per_worker * _chunk_size * workers)
+        stop = threading.Event()
+        with Pool(workers) as pool:
+            try:
+                for entries in pool.imap_unordered(game_entries, bounded(tasks, slots, stop), _chunk_size):
+                    slots.release()
+                    count(entries)
+            finally:
+                # writing a run can fail, and the pool cannot shut down while its feeder waits for a slot
+                stop.set()
+
+    if counts:
+        runs.append(write_run(counts))
+    return runs, games, moves
+
+
+def build(path, paths, workers=None, max_ply=None, max_entries=_max_entries):
+    """
+    writes a statistics file from recorded games
+    :param path: path of the statistics file to create
+    :param paths: iterable of journal file paths, read lazily
+    :param workers: int for the number of worker processes, default is one per core
+    :param max_ply: int for the number of moves from the start of each game to count, None for every move
+    :param max_entries: int for the most position and move pairs counted in memory at once
+    :return: tuple containing the number of games, moves, and records written
+    """
+    runs, games, moves = collect(paths, workers, max_ply, max_entries)
+
+    count = 0
+    f = open(path, 'wb')
+    f.write(_header.pack(_magic, _version, 0))
+    for record in merge_runs(runs):
+        f.write(_record.pack(*record))
+        count += 1
+    f.seek(0)
+    f.write(_header.pack(_magic, _version, count))
+    f.close()
+
+    for run in runs:
+        run.close()
+    return games, moves, count
+
+
+class PositionStats:
+    """
+    read-only statistics file, memory-mapped and searched by position key without being loaded
+    """
+
+    def __init__(self, path):
+
+        self._path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = _header.unpack_from(self._map, 0)
+        if magic != _magic or version != _version:
+            self.close()
+            raise ValueError('%s is not a statistics file' % path)
+        self._count = count
+
+
+    def get_path(self):
+        return self._path
+
+    def __len__(self):
+        return self._count
+
+
+    def record_at(self, i):
+        """
+        reads a record
+        :param i: int for the record number
+        :return: tuple containing the position key, move code, times played, wins, draws, and losses
+        """
+        return _record.unpack_from(self._map, _header.size + i * _record.size)
+
+
+    def find(self, key):
+        """
+        finds the moves played from a position with a binary search
+        :param key: int zobrist key, e.g. from Game.get_key()
+        :return: list of tuples containing the move code, times played, wins, draws, and losses
+        """
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record_at(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        while low < self._count:
+            record = self.record_at(low)
+            if record[0] != key:
+                break
+            found.append(record[1:])
+            low += 1
+        return found
+
+
+    def moves(self, game):
+        """
+        lists the moves played from a position, most played first
+        :param game: Game object
+        :return: list of tuples containing the move as given by Game.legal_moves(), times played, wins, draws,
+                 and losses, counted for the player making the move; games that did not finish are only counted
+                 in the times played
+        """
+        found = []
+        for code, played, wins, draws, losses in self.find(game.get_key()):
+            move = decode_move(game, code)
+            if move is not None:
+                found.append((move, played, wins, draws, losses))
+        found.sort(key=lambda item: -item[1])
+        return found
+
+
+    def totals(self, game):
+        """
+        adds up the results of every game that reached a position
+        :param game: Game object
+        :return: tuple containing times reached, wins, draws, and losses, counted for the player whose turn it is;
+                 games that did not finish are only counted in the times reached
+        """
+        totals = [0, 0, 0, 0]
+        for record in self.find(game.get_key()):
+            for i in range(len(totals)):
+                totals[i] += record[i + 1]
+        return tuple(totals)
+
+
+    def close(self):
+        """
+        unmaps and closes the statistics file
+        :return: None
+        """
+        self._map.close()
+        self._file.close()
+
+
+def percent(count, total):
+    if not total:
+        return 0.0
+    return 100.0 * count / total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build or query win rates and move frequencies of positions')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='count the positions and moves of recorded games')
+    build_parser.add_argument('stats', help='statistics file to create')
+    build_parser.add_argument('games', nargs='+',
+                              help='journal files or directories of them, - reads paths from standard input')
+    build_parser.add_argument('-w', '--workers', type=int, default=None,
+                              help='number of worker processes, default is one per core')
+    build_parser.add_argument('--max-ply', type=int, default=None,
+                              help='moves from the start of each game to count, default is every move')
+    build_parser.add_argument('--max-entries', type=int, default=_max_entries,
+                              help='most position and move pairs counted in memory at once')
+
+    query_parser = commands.add_parser('query', help='show the statistics of a position')
+    query_parser.add_argument('stats', help='statistics file to read')
+    query_parser.add_argument('position', nargs='?', default=None, help='save file format string or SFEN')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        games, moves, count = build(args.stats, find_games(args.games), args.workers, args.max_ply,
+                                    args.max_entries)
+        elapsed = time.perf_counter() - start
+        print('Games: %d' % games)
+        print('Moves: %d' % moves)
+        print('Position and move records: %d' % count)
+        print('Time: %.3fs' % elapsed)
+        if elapsed:
+            print('Games/second: %.1f' % (games / elapsed))
+        return 0
+
+    game = Game(cache_size=0)
+    if args.position is not None and not (game.from_sfen(args.position) or game.set_up_board(args.position)):
+        print('Position could not be set up')
+        return 1
+    stats = PositionStats(args.stats)
+    played, wins, draws, losses = stats.totals(game)
+    if not played:
+        print('Position is not in the statistics')
+        stats.close()
+        return 1
+
+    # rates are of the games that finished
+    finished = wins + draws + losses
+    print('Reached %d times  unfinished %d  won %.1f%%  drawn %.1f%%  lost %.1f%%' % (
+        played, played - finished, percent(wins, finished), percent(draws, finished), percent(losses, finished)))
+    for move, move_played, move_wins, move_draws, move_losses in stats.moves(game):
+        move_finished = move_wins + move_draws + move_losses
+        print('%-8s played %d (%.1f%%)  unfinished %d  won %.1f%%  drawn %.1f%%  lost %.1f%%' % (
+            move_to_string(move), move_played, percent(move_played, played), move_played - move_finished,
+            percent(move_wins, move_finished), percent(move_draws, move_finished),
+            percent(move_losses, move_finished)))
+    stats.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,9 +2,13 @@ from tkinter import *
 from shogi_files.pieces import *
 from shogi_files.game import *
 from shogi_files.popup import *
-from copy import *
+from shogi_files.save_store import describe_save
+from shogi_files.record import GameJournal
+from shogi_files.history import MoveHistory
+from tkinter.simpledialog import askinteger
 import requests
 import os
+import time
 
 
 # flip  = 'http://192.168.0.21:7534'
@@ -16,13 +20,19 @@ class Board(Frame):
     _edge_len = 50
 
 
-    def __init__(self, parent, game):
+    # most moves that can be undone, None for no limit
+    _history_limit = None
+
+    def __init__(self, parent, game, engine=None):
 
         Frame.__init__(self, parent)
 
         # the game being played
         self._game = game
 
+        # computer player for player 2, or None for two human players
+        self._engine = engine
+
         # set up the GUI
         self._width, self._height = self._game.get_board_dims()
         self._header = None
@@ -38,9 +48,11 @@ class Board(Frame):
         # tuple containing the piece that moved last and the space it moved from
         self._just_moved = None
 
-        # list of Game objects as the game progresses to allow undoing moves
-        self._undo_back_up = []
-        self._redo_back_up = []
+        # moves made as the game progresses to allow undoing and redoing them
+        self._history = MoveHistory(self._history_limit)
+
+        # record moves as they are played
+        self.start_journal()
 
         # draw the game
         self.show_pieces()
@@ -323,13 +335,11 @@ class Board(Frame):
 
             # move the piece to the clicked space if possible
             if (col, row) in self._to_be_moved[1]:
-                self._undo_back_up.append(deepcopy(self._game))
-                self._just_moved = self._to_be_moved[0], copy(self._to_be_moved[0].get_space())
-                self._game.move_piece(self._to_be_moved[0], (col, row))
+                self._just_moved = self._to_be_moved[0], self._to_be_moved[0].get_space()
+                self._history.push(self._game.move_piece(self._to_be_moved[0], (col, row)))
                 self.show_pieces()
                 self._game.switch_turn()
                 self._to_be_moved = None
-                self._redo_back_up = []
 
 
                 # check promotion availability and produce pop up if desired
@@ -338,6 +348,7 @@ class Board(Frame):
                         self.promotion_popup(self._just_moved[0])
 
                 self.check_for_check()
+                self.engine_move()
 
 
             # deselect the piece
@@ -353,6 +364,24 @@ class Board(Frame):
                 self.show_possible_moves(piece, col, row)
 
 
+    def start_journal(self):
+        """
+        starts a new journal file recording the game from its current position
+        :return: None
+        """
+        journal = self._game.get_journal()
+        if journal is not None:
+            journal.close()
+
+        name = time.strftime('game_%Y%m%d_%H%M%S')
+        path = os.path.join(self._game.get_record_location(), name + '.jnl')
+        count = 1
+        while os.path.exists(path):
+            count += 1
+            path = os.path.join(self._game.get_record_location(), name + '_' + str(count) + '.jnl')
+        self._game.set_journal(GameJournal(path, self._game))
+
+
     def check_for_check(self):
         """
         changes the header depending on the game state
@@ -361,12 +390,39 @@ class Board(Frame):
         if self._game.is_in_check(self._game.get_turn()):
             if self._game.is_in_checkmate(self._game.get_turn()):
                 self.change_header('Wins!', not self._game.get_turn())
+                if self._game.get_journal() is not None:
+                    self._game.get_journal().record_result(not self._game.get_turn())
             else:
                 self.change_header('is in check!', self._game.get_turn())
         else:
             self.change_header()
 
 
+    def engine_move(self):
+        """
+        lets the computer player move if it is their turn
+        :return: None
+        """
+        if self._engine is None or self._game.is_finished() or self._game.get_turn():
+            return
+
+        self.change_header('is thinking...', self._game.get_turn())
+        self.update_idletasks()
+
+        move = self._engine.best_move(self._game)
+        if move is None:
+            return
+        piece, origin, destination, promote = move
+        self._history.push(self._game.move_piece(piece, destination))
+        if promote:
+            self._history.set_promotion(piece.get_state())
+            self._game.promote_piece(piece)
+        self._just_moved = piece, origin
+        self._game.switch_turn()
+        self.show_pieces()
+        self.check_for_check()
+
+
     def right_click(self, event):
         """
         information for the clicked piece
@@ -386,8 +442,13 @@ class Board(Frame):
         :param piece: piece to be promoted
         :return: None
         """
-        popup = promotion_alert(piece)
+        state = piece.get_state()
+        was_promoted = piece.is_promoted()
+        popup = promotion_alert(piece, self._game.promote_piece)
         self.wait_window(popup)
+        # declining with "do not ask again" only changes the alert setting, which is not a promotion to redo
+        if piece.is_promoted() and not was_promoted:
+            self._history.set_promotion(state)
         self.show_pieces()
 
 
@@ -428,18 +489,17 @@ class Board(Frame):
 
     def undo(self):
         """
-        go backwards one step
+        go backwards one step, or back to the human player's turn when playing the computer
         :return: None
         """
         self._bg.delete('circle')
-        if not self._undo_back_up:
+        if not self._history.can_undo():
             self.change_header('Cannot go further backwards')
         else:
-            self._redo_back_up.append(deepcopy(self._game))
-            self._game.undo_checkmate()
-            self._game = self._undo_back_up.pop()
-            self.change_header()
-            self.show_pieces()
+            self._history.undo(self._game)
+            if self._engine is not None and not self._game.get_turn():
+                self._history.undo(self._game)
+            self.show_move()
 
 
     def redo(self):
@@ -451,13 +511,39 @@ class Board(Frame):
         if self._game.is_finished():
             return
 
-        if not self._redo_back_up:
+        if not self._history.can_redo():
             self.change_header('Cannot go further forwards')
         else:
-            self._undo_back_up.append(deepcopy(self._game))
-            self._game = self._redo_back_up.pop()
-            self.check_for_check()
-            self.show_pieces()
+            self._history.redo(self._game)
+            if self._engine is not None and not self._game.get_turn():
+                self._history.redo(self._game)
+            self.show_move()
+
+
+    def go_to_move(self):
+        """
+        ask user for a move number and go backwards or forwards to it
+        :return: None
+        """
+        ply = askinteger('Go to Move', 'Number of moves from the start (0 to %d):' % len(self._history),
+                         parent=self, minvalue=0, maxvalue=len(self._history))
+        if ply is None:
+            return
+
+        self._bg.delete('circle')
+        self._history.go_to(self._game, ply)
+        self.show_move()
+
+
+    def show_move(self):
+        """
+        redraws the game after moving through the history
+        :return: None
+        """
+        self._to_be_moved = None
+        self._just_moved = self._history.last_moved()
+        self.check_for_check()
+        self.show_pieces()
 
 
     def new_game(self):
@@ -473,37 +559,38 @@ class Board(Frame):
             self._game.set_up_board()
             self._to_be_moved = None
             self._just_moved = None
-            self._undo_back_up = []
+            self._history.clear()
+            self.start_journal()
             self.show_pieces()
             self.change_header()
 
 
     def load_game(self):
         """
-        find list of save files and load a selected file if possible
+        find list of saved games and load a selected one if possible
         :return: None
         """
-        if not os.path.isdir('shogi_files/saves'):
-            popup = alert_popup('Save directory not found', 'Load Error')
-            self.wait_window(popup)
-            return
-
-        files = [f for f in os.listdir('shogi_files/saves') if f.startswith('shogi_save')]
-        files = [f for f in files if f.endswith('.txt')]
-        if not files:
+        saves = self._game.get_save_store().find()
+        if not saves:
             popup = alert_popup('No game saves found', 'Load Error')
             self.wait_window(popup)
             return
 
+        descriptions = {describe_save(save): save[0] for save in saves}
+
         load = SaveLoad()
-        popup = load.load_popup(files)
+        popup = load.load_popup(list(descriptions))
         self.wait_window(popup)
 
         filename = load.get_filename()
         if filename == '':
             return
 
-        if self._game.load_game('shogi_files/saves/' + filename):
+        if self._game.load_save(descriptions[filename]):
+            self._to_be_moved = None
+            self._just_moved = None
+            self._history.clear()
+            self.start_journal()
             self.show_pieces()
             self.change_header()
         else:
@@ -553,6 +640,7 @@ def set_up_menu(root, board):
     file_options.add_command(label='New Game', command=board.new_game)
     file_options.add_command(label='Load Game', command=board.load_game)
     file_options.add_command(label='Save Game', command=board.save_game)
+    file_options.add_command(label='Go to Move', command=board.go_to_move)
     file_options.add_separator()
     file_options.add_command(label='Quit', command=board.quit_game)
     menu_bar.add_cascade(label='File', menu=file_options)
@@ -565,15 +653,16 @@ def set_up_menu(root, board):
     root.config(menu=menu_bar)
 
 
-def display_board(game):
+def display_board(game, engine=None):
     """
     set up and display game GUI
-    :param game: game being played
+    :param game: Game object being played, or a BitboardGame for the bitboard backend
+    :param engine: Engine object to play as player 2, or None for two human players
     :return: None
     """
     root = Tk()
     root.title('Shogi - by Alexander Kim (kima4) for CS361')
-    gui = Board(root, game)
+    gui = Board(root, game, engine)
     set_up_menu(root, gui)
     gui.pack(side='top', fill='both', expand='true', padx=4, pady=4)
     root.geometry("862x701")
@@ -0,0 +1,342 @@
+from shogi_files.game import *
+from shogi_files.bitboard import BitboardGame
+from shogi_files.perft import move_to_string
+import argparse
+import sys
+import time
+
+
+# proof and disproof number of a node that is proven or disproven
+infinity = 1 << 30
+
+
+def could_check(king_space, origin, destination):
+    """
+    rules out moves that cannot give check whatever the pieces, since the moving piece ends up out of reach of the
+    king and does not uncover a line to it, so most quiet moves need not be tried on the board
+    :param king_space: tuple containing the location of the king to check, or None if there is none
+    :param origin: tuple containing the origin of the move, (0, 0) for a drop
+    :param destination: tuple containing the destination of the move
+    :return: False if the move cannot give check
+    """
+    if king_space is None:
+        return True
+    for space in (destination, origin):
+        if space == (0, 0):
+            continue
+        x = space[0] - king_space[0]
+        y = space[1] - king_space[1]
+        if x == 0 or y == 0 or abs(x) == abs(y):
+            return True
+        # knights are the only pieces attacking from off the lines through the king
+        if space is destination and abs(x) == 1 and abs(y) == 2:
+            return True
+    return False
+
+
+class TsumeSolver:
+    """
+    finds forced checkmates with depth-first proof-number search
+    the player whose turn it is attacks and may only make checking moves, including drops; the other player
+    may make any legal move, so a proof is a mate against every defence
+    """
+
+    def __init__(self, node_limit=1000000, table_size=1 << 20):
+
+        # most nodes to search before giving up
+        self._node_limit = node_limit
+
+        # proof and disproof numbers of searched positions along with the keys of the positions on the search path
+        # they depend on through repetitions, the least recently used are forgotten when full
+        self._table = PositionCache(table_size)
+
+        self._nodes = 0
+        self._elapsed = 0.0
+        self._result = None
+        self._pv = []
+        self._proof_size = 0
+
+        # keys of the positions on the current search path, to treat repetitions as failures to mate
+        self._path = set()
+
+
+    def get_nodes(self):
+        return self._nodes
+
+    def get_elapsed(self):
+        return self._elapsed
+
+    def get_result(self):
+        return self._result
+
+    def get_proof_size(self):
+        return self._proof_size
+
+    def get_nps(self):
+        if not self._elapsed:
+            return 0.0
+        return self._nodes / self._elapsed
+
+    def principal_variation(self):
+        return list(self._pv)
+
+
+    def solve(self, game):
+        """
+        searches for a forced checkmate by the player whose turn it is
+        :param game: Game object, which is left as it was found
+        :return: True if there is a forced mate, False if there is none, None if the node limit was reached first
+        """
+        self._nodes = 0
+        self._path = set()
+        self._pv = []
+        self._proof_size = 0
+        start = time.perf_counter()
+
+        proof, disproof = self.mid(game, infinity, infinity, True)
+        if proof == 0:
+            self._result = True
+            sizes = {}
+            self._proof_size = self.proof_size(game, True, sizes, set())
+            self._pv = self.find_pv(game, sizes)
+        elif disproof == 0:
+            self._result = False
+        else:
+            self._result = None
+
+        self._elapsed = time.perf_counter() - start
+        return self._result
+
+
+    def lookup(self, key):
+        """
+        finds the proof and disproof numbers of a position
+        :param key: int zobrist key of the position
+        :return: tuple containing the proof and disproof numbers, 1 and 1 if the position has not been searched
+                 or was searched from a path that repeated positions no longer on the search path
+        """
+        if key in self._path:
+            # going round in a circle never mates
+            return infinity, 0
+        entry = self._table.lookup(key, 'dfpn')
+        if entry is None or not entry[2] <= self._path:
+            return 1, 1
+        return entry[:2]
+
+
+    def loops(self, key, children):
+        """
+        finds the positions on the search path that the numbers of a position depend on through repetitions
+        :param key: int zobrist key of the position
+        :param children: list of tuples as given by child_moves()
+        :return: frozenset of keys
+        """
+        loops = set()
+        for move, child_key in children:
+            if child_key in self._path:
+                loops.add(child_key)
+            else:
+                entry = self._table.lookup(child_key, 'dfpn')
+                if entry is not None:
+                    loops |= entry[2]
+        loops.discard(key)
+        return frozenset(loops)
+
+
+    def child_moves(self, game, attacker):
+        """
+        lists the moves searched from a position along with the key of the position each leads to
+        :param game: Game object
+        :param attacker: True if it is the attacking player's turn, who may only make checking moves
+        :return: list of tuples containing the move as given by Game.legal_moves() and the key after it
+        """
+        player = game.get_turn()
+        king = game.get_player_king(not player)
+        king_space = king.get_space() if king is not None else None
+        children = []
+        for move in list(game.legal_moves(player)):
+            if attacker and not could_check(king_space, move[1], move[2]):
+                continue
+            undo_record = game.make_move(*move)
+            game.switch_turn()
+            if not attacker or game.is_in_check(not player):
+                children.append((move, game.get_key()))
+            game.switch_turn()
+            game.unmake_move(undo_record)
+        return children
+
+
+    def mid(self, game, proof_limit, disproof_limit, attacker):
+        """
+        searches a position until its proof number or disproof number reaches its limit
+        :param game: Game object, which is left as it was found
+        :param proof_limit: int the proof number must stay below
+        :param disproof_limit: int the disproof number must stay below
+        :param attacker: True if it is the attacking player's turn
+        :return: tuple containing the proof and disproof numbers of the position
+        """
+        self._nodes += 1
+        key = game.get_key()
+        children = self.child_moves(game, attacker)
+
+        if not children:
+            # the attacker has no checks left, or the defender is mated
+            if attacker:
+                numbers = infinity, 0
+            else:
+                numbers = 0, infinity
+            self._table.store(key, 'dfpn', numbers + (frozenset(),))
+            return numbers
+
+        self._path.add(key)
+        while True:
+            child_numbers = [self.lookup(child_key) for move, child_key in children]
+
+            if attacker:
+                proof = min(child_proof for child_proof, child_disproof in child_numbers)
+                disproof = min(infinity, sum(child_disproof for child_proof, child_disproof in child_numbers))
+            else:
+                proof = min(infinity, sum(child_proof for child_proof, child_disproof in child_numbers))
+                disproof = min(child_disproof for child_proof, child_disproof in child_numbers)
+
+            if proof >= proof_limit or disproof >= disproof_limit or self._nodes >= self._node_limit:
+                break
+
+            # the attacker follows the child easiest to prove, the defender the child easiest to disprove
+            side = 0 if attacker else 1
+            order = sorted(range(len(children)), key=lambda i: child_numbers[i][side])
+            best = order[0]
+            second = child_numbers[order[1]][side] if len(order) > 1 else infinity
+            best_proof, best_disproof = child_numbers[best]
+
+            if attacker:
+                child_proof_limit = min(proof_limit, second + 1)
+                child_disproof_limit = min(infinity, disproof_limit - disproof + best_disproof)
+            else:
+                child_proof_limit = min(infinity, proof_limit - proof + best_proof)
+                child_disproof_limit = min(disproof_limit, second + 1)
+
+            undo_record = game.make_move(*children[best][0])
+            game.switch_turn()
+            self.mid(game, child_proof_limit, child_disproof_limit, not attacker)
+            game.switch_turn()
+            game.unmake_move(undo_record)
+
+        # a proof never rests on a repetition, but a disproof or a partial result can, and holds only while the
+        # repeated positions are still on the search path
+        loops = frozenset() if proof == 0 else self.loops(key, children)
+        self._path.discard(key)
+
+        self._table.store(key, 'dfpn', (proof, disproof, loops))
+        return proof, disproof
+
+
+    def proven_children(self, game, attacker):
+        """
+        lists the moves from a proven position that lead to proven positions
+        :param game: Game object
+        :param attacker: True if it is the attacking player's turn
+        :return: list of tuples as given by child_moves()
+        """
+        return [(move, child_key) for move, child_key in self.child_moves(game, attacker)
+                if self._table.lookup(child_key, 'dfpn') is not None
+                and self._table.lookup(child_key, 'dfpn')[0] == 0]
+
+
+    def proof_size(self, game, attacker, sizes, path):
+        """
+        counts the positions in the smallest proof tree found, choosing the smallest proof at attacker nodes
+        :param game: Game object in a proven position, which is left as it was found
+        :param attacker: True if it is the attacking player's turn
+        :param sizes: dictionary of position key to proof size, filled in as positions are counted
+        :param path: set of keys of the positions leading here
+        :return: int for the number of positions in the proof tree
+        """
+        key = game.get_key()
+        if key in sizes:
+            return sizes[key]
+        if key in path:
+            return infinity
+
+        path.add(key)
+        child_sizes = []
+        for move, child_key in self.proven_children(game, attacker):
+            undo_record = game.make_move(*move)
+            game.switch_turn()
+            child_sizes.append(self.proof_size(game, not attacker, sizes, path))
+            game.switch_turn()
+            game.unmake_move(undo_record)
+        path.discard(key)
+
+        if not child_sizes:
+            size = 1
+        elif attacker:
+            size = min(infinity, 1 + min(child_sizes))
+        else:
+            size = min(infinity, 1 + sum(child_sizes))
+        sizes[key] = size
+        return size
+
+
+    def find_pv(self, game, sizes):
+        """
+        follows the proof from the root, the attacker taking the smallest proof and the defender the largest
+        :param game: Game object in the proven root position, which is left as it was found
+        :param sizes: dictionary filled in by proof_size()
+        :return: list of tuples as given by Game.legal_moves()
+        """
+        pv = []
+        undo_records = []
+        attacker = True
+        seen = set()
+        while game.get_key() not in seen:
+            seen.add(game.get_key())
+            children = [(sizes.get(child_key, infinity), i, move)
+                        for i, (move, child_key) in enumerate(self.proven_children(game, attacker))]
+            if not children:
+                break
+            if attacker:
+                size, i, move = min(children)
+            else:
+                size, i, move = max(children)
+            pv.append(move)
+            undo_records.append(game.make_move(*move))
+            game.switch_turn()
+            attacker = not attacker
+
+        for undo_record in reversed(undo_records):
+            game.switch_turn()
+            game.unmake_move(undo_record)
+        return pv
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='find a forced checkmate for the player whose turn it is')
+    parser.add_argument('position', help='save file format string or SFEN')
+    parser.add_argument('-n', '--nodes', type=int, default=1000000, help='most nodes to search')
+    args = parser.parse_args(argv)
+
+    # problems usually leave out the attacking king and the pieces not in play
+    game = BitboardGame()
+    if not (game.from_sfen(args.position, True) or game.set_up_board(args.position, True)):
+        print('Position could not be set up')
+        return 1
+
+    solver = TsumeSolver(args.nodes)
+    result = solver.solve(game)
+    if result:
+        print('Mate in %d: %s' % (len(solver.principal_variation()),
+                                  ' '.join(move_to_string(move) for move in solver.principal_variation())))
+        print('Proof size: %d' % solver.get_proof_size())
+    elif result is None:
+        print('No result within %d nodes' % args.nodes)
+    else:
+        print('No forced mate')
+    print('Nodes: %d' % solver.get_nodes())
+    print('Time: %.3fs' % solver.get_elapsed())
+    print('Nodes/second: %.0f' % solver.get_nps())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
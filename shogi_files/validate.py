@@ -0,0 +1,114 @@
+from shogi_files.game import *
+from shogi_files.replay import bounded
+from multiprocessing import Pool
+import argparse
+import threading
+import sys
+import time
+
+
+# game used by each worker process to check save strings
+_worker_game = None
+
+
+def read_save_strings(paths):
+    """
+    reads save strings one at a time from save files, text files with one save string per line, or directories of them
+    :param paths: iterable of paths, '-' reads save strings from standard input
+    :return: generator of tuples containing where the string came from and the save string
+    """
+    for path in paths:
+        if path == '-':
+            for line_num, line in enumerate(sys.stdin, 1):
+                if line.strip():
+                    yield '<stdin>:%d' % line_num, line.strip()
+        elif os.path.isdir(path):
+            for entry in os.scandir(path):
+                if entry.is_dir() or entry.name.endswith('.txt'):
+                    yield from read_save_strings([entry.path])
+        else:
+            f = open(path, 'r')
+            for line_num, line in enumerate(f, 1):
+                if line.strip():
+                    yield '%s:%d' % (path, line_num), line.strip()
+            f.close()
+
+
+def check_save_string(item):
+    """
+    checks one save string, run in a worker process
+    :param item: tuple containing where the string came from and the save string
+    :return: tuple containing where the string came from and the problem found, or None if it is legal
+    """
+    global _worker_game
+    if _worker_game is None:
+        _worker_game = Game(cache_size=0)
+    source, save_str = item
+    return source, _worker_game.find_problem(save_str)
+
+
+def validate(items, workers=None, chunk_size=256):
+    """
+    checks many save strings in a process pool
+    :param items: iterable of tuples as given by read_save_strings(), read lazily
+    :param workers: int for the number of worker processes, default is one per core, 1 checks in this process
+    :param chunk_size: int for the number of save strings sent to a worker at once
+    :return: generator of tuples as given by check_save_string(), in the order given
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for item in items:
+            yield check_save_string(item)
+        return
+
+    # the pool reads its input as fast as it can, so strings are let through only as results are taken,
+    # with enough for every worker to have a chunk running and another waiting
+    slots = threading.Semaphore(2 * chunk_size * workers)
+    stop = threading.Event()
+    with Pool(workers) as pool:
+        try:
+            for result in pool.imap(check_save_string, bounded(items, slots, stop), chunk_size):
+                slots.release()
+                yield result
+        finally:
+            stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='check save strings for legal piece distributions and positions')
+    parser.add_argument('paths', nargs='+',
+                        help='save files, text files with one save string per line, or directories of them, '
+                             '- reads from standard input')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes, default is one per core')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only show the summary')
+    args = parser.parse_args(argv)
+
+    checked = 0
+    problems = {}
+    start = time.perf_counter()
+    for source, problem in validate(read_save_strings(args.paths), args.workers):
+        checked += 1
+        if problem is None:
+            continue
+        kind = problem.split(':')[0]
+        problems[kind] = problems.get(kind, 0) + 1
+        if not args.quiet:
+            print('%s: %s' % (source, problem))
+    elapsed = time.perf_counter() - start
+
+    invalid = sum(problems.values())
+    print('Checked: %d' % checked)
+    print('Legal: %d' % (checked - invalid))
+    print('Illegal: %d' % invalid)
+    for kind, count in sorted(problems.items(), key=lambda item: -item[1]):
+        print('  %s: %d' % (kind, count))
+    print('Time: %.3fs' % elapsed)
+    if elapsed:
+        print('Save strings/second: %.0f' % (checked / elapsed))
+    return 1 if invalid else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
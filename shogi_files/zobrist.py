@@ -0,0 +1,39 @@
+from shogi_files.pieces import *
+import random
+
+
+# fixed seed so the same position has the same key in every process and every run
+_seed = 361
+
+_squares = 81
+
+# most pieces of one kind a player can hold in their jail
+_max_held = 18
+
+# number of kinds that can be held in a jail, see piece_kinds
+# kings are included since one can be captured while testing moves that are not legal
+_held_kinds = king_kind + 1
+
+
+def build_keys():
+    """
+    creates the random 64-bit numbers that are combined to make a position key
+    :return: tuple containing the piece keys indexed by player, kind, and square, the jail keys
+             indexed by player, kind, and count, and the key for player 2 having the turn
+    """
+    rng = random.Random(_seed)
+
+    piece_keys = {}
+    jail_keys = {}
+    for player in (True, False):
+        piece_keys[player] = [[rng.getrandbits(64) for index in range(_squares)]
+                              for kind in piece_kinds]
+        # holding none of a kind adds nothing to the key
+        jail_keys[player] = [[0] + [rng.getrandbits(64) for count in range(_max_held)]
+                             for kind in range(_held_kinds)]
+
+    turn_key = rng.getrandbits(64)
+    return piece_keys, jail_keys, turn_key
+
+
+piece_keys, jail_keys, turn_key = build_keys()